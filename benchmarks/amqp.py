@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import logging
+import struct
+
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+
+log = logging.getLogger(__name__)
+
+FRAME = struct.Struct("<cQHI")
+
+
+def write_frame(writer, op, tag=0, name="", body=b""):
+    name = name.encode("utf-8")
+    writer.write(FRAME.pack(op, tag, len(name), len(body)) + name + body)
+
+
+async def read_frame(reader):
+    op, tag, name_length, body_length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    name = await reader.readexactly(name_length)
+    body = await reader.readexactly(body_length)
+    return op, tag, name.decode("utf-8"), body
+
+
+class Consumer:
+    def __init__(self, writer, queue, prefetch):
+        self.writer = writer
+        self.queue = queue
+        self.prefetch = prefetch
+        self.unacked = {}
+
+    @property
+    def available(self):
+        return self.prefetch == 0 or len(self.unacked) < self.prefetch
+
+
+class Broker:
+    def __init__(self):
+        self.queues = defaultdict(deque)
+        self.consumers = defaultdict(list)
+        self.published = Counter()
+        self.acked = Counter()
+
+        self._tags = itertools.count(1)
+        self._server = None
+        self._writers = set()
+
+    def publish(self, routing_key, body):
+        self.published[routing_key] += 1
+
+        self.queues[routing_key].append(body)
+        self._dispatch(routing_key)
+
+    def _dispatch(self, name):
+        queue = self.queues[name]
+
+        while queue:
+            consumers = [x for x in self.consumers[name] if x.available]
+            if not consumers:
+                return
+
+            for consumer in consumers:
+                if not queue:
+                    return
+
+                tag = next(self._tags)
+                consumer.unacked[tag] = queue.popleft()
+                write_frame(consumer.writer, b"D", tag, name, consumer.unacked[tag])
+
+    def _settle(self, consumers, op, tag):
+        for consumer in consumers:
+            body = consumer.unacked.pop(tag, None)
+            if body is None:
+                continue
+
+            if op == b"A":
+                self.acked[consumer.queue] += 1
+            elif op == b"N":
+                self.queues[consumer.queue].appendleft(body)
+
+            self._dispatch(consumer.queue)
+            return
+
+    def _remove(self, consumer):
+        self.consumers[consumer.queue].remove(consumer)
+        self.queues[consumer.queue].extendleft(reversed(list(consumer.unacked.values())))
+        self._dispatch(consumer.queue)
+
+    async def _handle(self, reader, writer):
+        consumers = []
+        self._writers.add(writer)
+
+        try:
+            while True:
+                op, tag, name, body = await read_frame(reader)
+
+                if op == b"P":
+                    self.publish(name, body)
+                elif op == b"Q":
+                    consumer = Consumer(writer, name, tag)
+                    consumers.append(consumer)
+                    self.consumers[name].append(consumer)
+                    self._dispatch(name)
+                elif op in [b"A", b"R", b"N"]:
+                    self._settle(consumers, op, tag)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for consumer in consumers:
+                self._remove(consumer)
+
+            self._writers.discard(writer)
+            writer.close()
+
+    def consumer_count(self, name):
+        return len(self.consumers[name])
+
+    def depth(self, name):
+        return len(self.queues[name]) + sum(len(x.unacked) for x in self.consumers[name])
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    async def stop(self):
+        self._server.close()
+
+        for writer in list(self._writers):
+            writer.close()
+
+        await self._server.wait_closed()
+
+
+class IncomingMessage:
+    def __init__(self, connection, tag, body):
+        self.body = body
+        self.delivery_tag = tag
+        self.processed = False
+
+        self._connection = connection
+
+    def _settle(self, op):
+        if self.processed:
+            raise RuntimeError("The message is already processed.")
+
+        self.processed = True
+        write_frame(self._connection.writer, op, self.delivery_tag)
+
+    def ack(self):
+        self._settle(b"A")
+
+    def reject(self, requeue=False):
+        self._settle(b"N" if requeue else b"R")
+
+    def nack(self, requeue=True):
+        self.reject(requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue=False, reject_on_redelivered=False, ignore_processed=False):
+        try:
+            yield self
+
+            if not ignore_processed and not self.processed:
+                self.ack()
+        except BaseException:
+            if not ignore_processed and not self.processed:
+                self.reject(requeue)
+            raise
+
+
+class QueueIterator:
+    def __init__(self, queue):
+        self._queue = queue
+        self._messages = None
+
+    async def __aenter__(self):
+        self._messages = self._queue.channel.connection.consume(
+            self._queue.name, self._queue.channel.prefetch_count
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._messages.get()
+        if message is None:
+            raise StopAsyncIteration
+
+        return message
+
+
+class Queue:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+
+    def iterator(self):
+        return QueueIterator(self)
+
+
+class Exchange:
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def publish(self, message, routing_key, **kwargs):
+        write_frame(self._connection.writer, b"P", 0, routing_key, message.body)
+        await self._connection.writer.drain()
+
+
+class Channel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.prefetch_count = 0
+        self.default_exchange = Exchange(connection)
+
+    async def set_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def get_queue(self, name, ensure=True):
+        return Queue(self, name)
+
+    async def declare_queue(self, name, **kwargs):
+        return Queue(self, name)
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.writer = writer
+
+        self._reader = reader
+        self._deliveries = {}
+        self._task = asyncio.get_event_loop().create_task(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                op, tag, name, body = await read_frame(self._reader)
+
+                if op == b"D":
+                    self._deliveries[name].put_nowait(IncomingMessage(self, tag, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            log.warning("The connection to the broker was closed.")
+        finally:
+            for messages in self._deliveries.values():
+                messages.put_nowait(None)
+
+    def consume(self, name, prefetch):
+        self._deliveries[name] = asyncio.Queue()
+        write_frame(self.writer, b"Q", prefetch, name)
+        return self._deliveries[name]
+
+    async def channel(self):
+        return Channel(self)
+
+    async def close(self):
+        self._task.cancel()
+        self.writer.close()
+
+
+async def connect_robust(host="127.0.0.1", port=5672, **kwargs):
+    reader, writer = await asyncio.open_connection(host, int(port))
+    return Connection(reader, writer)
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import gzip
+import struct
+import time
+
+import aio_pika
+import aioredis
+import orjson
+
+from utils.config import Config
+
+MAGIC = b"MMCAP1"
+RECORD = struct.Struct("<cdI")
+
+
+def write_record(file, kind, offset, payload):
+    file.write(RECORD.pack(kind, offset, len(payload)))
+    file.write(payload)
+
+
+def read_capture(path):
+    with gzip.open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file.")
+
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+
+            kind, offset, length = RECORD.unpack(header)
+            yield kind, offset, file.read(length)
+
+
+def _decode(value):
+    return value.decode("latin-1") if isinstance(value, bytes) else value
+
+
+async def snapshot(redis, file):
+    count = 0
+
+    async for key in redis.iscan(count=1000):
+        kind = await redis.type(key)
+
+        if kind == b"string":
+            value = await redis.get(key)
+        elif kind == b"set":
+            value = await redis.smembers(key)
+        elif kind == b"hash":
+            value = await redis.hgetall(key)
+        elif kind == b"zset":
+            value = dict(await redis.zrange(key, 0, -1, withscores=True))
+        else:
+            continue
+
+        if isinstance(value, dict):
+            value = {_decode(x): _decode(y) for x, y in value.items()}
+        elif isinstance(value, list):
+            value = [_decode(x) for x in value]
+        else:
+            value = _decode(value)
+
+        payload = {"key": _decode(key), "kind": kind.decode("utf-8"), "value": value}
+        write_record(file, b"K", 0, orjson.dumps(payload))
+        count += 1
+
+    return count
+
+
+async def capture(args):
+    config = Config().load()
+
+    redis = await aioredis.create_redis(
+        (config.REDIS_HOST, int(config.REDIS_PORT)), password=config.REDIS_PASSWORD
+    )
+    bot_user = orjson.loads(await redis.get("bot_user"))
+
+    connection = await aio_pika.connect_robust(
+        login=config.RABBIT_USERNAME,
+        password=config.RABBIT_PASSWORD,
+        host=config.RABBIT_HOST,
+        port=int(config.RABBIT_PORT),
+    )
+    channel = await connection.channel()
+    await channel.set_qos(prefetch_count=100)
+    queue = await channel.get_queue("gateway.recv")
+
+    with gzip.open(args.output, "wb") as file:
+        file.write(MAGIC)
+        write_record(file, b"H", 0, orjson.dumps({"bot_id": int(bot_user["id"])}))
+
+        if args.snapshot:
+            print(f"Captured {await snapshot(redis, file)} keys from Redis.")
+
+        start = time.perf_counter()
+        count = 0
+
+        async with queue.iterator() as queue_iter:
+            async for message in queue_iter:
+                offset = time.perf_counter() - start
+                write_record(file, b"E", offset, message.body)
+                message.ack()
+
+                count += 1
+                if count >= args.count or offset >= args.duration:
+                    break
+
+    print(f"Captured {count} events in {round(time.perf_counter() - start, 2)} seconds.")
+
+    await connection.close()
+    redis.close()
+    await redis.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record gateway events from the gateway.recv queue. Events are consumed, so "
+        "run this in place of a worker."
+    )
+    parser.add_argument("output", help="file to write the capture to")
+    parser.add_argument("--count", type=int, default=10000, help="maximum number of events")
+    parser.add_argument("--duration", type=float, default=300, help="maximum seconds to record")
+    parser.add_argument(
+        "--snapshot", action="store_true", help="also record the Redis state before capturing"
+    )
+
+    asyncio.run(capture(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
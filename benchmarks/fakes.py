@@ -0,0 +1,419 @@
+import asyncio
+import fnmatch
+import itertools
+import time
+
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from classes.bot import normalize_route
+from classes.http import HTTPClient
+from classes.state import DELETE_IF_EQUAL
+
+COLUMNS = {
+    "data": [
+        "guild",
+        "prefix",
+        "category",
+        "accessrole",
+        "logging",
+        "welcome",
+        "goodbye",
+        "loggingplus",
+        "pingrole",
+        "blacklist",
+        "anonymous",
+    ],
+    "snippet": ["guild", "name", "content"],
+    "premium": ["identifier", "guild", "expiry"],
+    "ban": ["identifier", "category"],
+    "account": ["identifier", "confirmation", "token"],
+}
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return str(value).encode("utf-8")
+
+
+def _key(key):
+    return key.decode("utf-8") if isinstance(key, bytes) else key
+
+
+class FakeRedis:
+    SET_IF_NOT_EXIST = "SET_IF_NOT_EXIST"
+
+    def __init__(self):
+        self.calls = Counter()
+
+        self._data = {}
+        self._expiry = {}
+
+    def load(self, key, kind, value):
+        if kind == "string":
+            self._data[key] = _encode(value)
+        elif kind == "set":
+            self._data[key] = {_encode(x) for x in value}
+        elif kind == "hash":
+            self._data[key] = {_encode(x): _encode(y) for x, y in value.items()}
+        elif kind == "zset":
+            self._data[key] = {_encode(x): float(y) for x, y in value.items()}
+
+    def _get(self, key, default=None):
+        key = _key(key)
+
+        expiry = self._expiry.get(key)
+        if expiry is not None and expiry <= time.monotonic():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+
+        return self._data.get(key, default)
+
+    def _call(self, command):
+        self.calls[command] += 1
+
+    async def get(self, key, *, encoding=None):
+        self._call("GET")
+        value = self._get(key)
+        return value.decode(encoding) if encoding and value is not None else value
+
+    async def mget(self, key, *keys):
+        self._call("MGET")
+        return [self._get(x) for x in (key, *keys)]
+
+    async def set(self, key, value, *, expire=0, pexpire=0, exist=None):
+        self._call("SET")
+
+        if exist == self.SET_IF_NOT_EXIST and self._get(key) is not None:
+            return False
+
+        self._data[_key(key)] = _encode(value)
+        self._expiry.pop(_key(key), None)
+
+        if expire or pexpire:
+            self._expiry[_key(key)] = time.monotonic() + (expire or pexpire / 1000)
+
+        return True
+
+    async def mset(self, *pairs):
+        self._call("MSET")
+
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self._data[_key(key)] = _encode(value)
+            self._expiry.pop(_key(key), None)
+
+    async def delete(self, key, *keys):
+        self._call("DEL")
+        return sum(self._data.pop(_key(x), None) is not None for x in (key, *keys))
+
+    async def eval(self, script, keys=[], args=[]):
+        self._call("EVAL")
+
+        if script != DELETE_IF_EQUAL:
+            raise NotImplementedError("Only the scripts used by State are supported.")
+
+        if self._get(keys[0]) != _encode(args[0]):
+            return 0
+
+        return int(self._data.pop(_key(keys[0]), None) is not None)
+
+    async def exists(self, key, *keys):
+        self._call("EXISTS")
+        return sum(self._get(x) is not None for x in (key, *keys))
+
+    async def expire(self, key, timeout):
+        self._call("EXPIRE")
+
+        if self._get(key) is None:
+            return False
+
+        self._expiry[_key(key)] = time.monotonic() + timeout
+        return True
+
+    async def pttl(self, key):
+        self._call("PTTL")
+
+        if self._get(key) is None:
+            return -2
+
+        expiry = self._expiry.get(_key(key))
+        return -1 if expiry is None else int((expiry - time.monotonic()) * 1000)
+
+    async def rename(self, key, newkey):
+        self._call("RENAME")
+        self._data[_key(newkey)] = self._data.pop(_key(key))
+
+    async def publish(self, channel, message):
+        self._call("PUBLISH")
+        return 0
+
+    async def smembers(self, key):
+        self._call("SMEMBERS")
+        return list(self._get(key, set()))
+
+    async def sadd(self, key, member, *members):
+        self._call("SADD")
+        value = self._data.setdefault(_key(key), set())
+        before = len(value)
+        value.update(_encode(x) for x in (member, *members))
+        return len(value) - before
+
+    async def srem(self, key, member, *members):
+        self._call("SREM")
+        value = self._get(key, set())
+        before = len(value)
+        value.difference_update(_encode(x) for x in (member, *members))
+        return before - len(value)
+
+    async def sismember(self, key, member):
+        self._call("SISMEMBER")
+        return _encode(member) in self._get(key, set())
+
+    async def scard(self, key):
+        self._call("SCARD")
+        return len(self._get(key, set()))
+
+    async def isscan(self, key, *, match=None, count=None):
+        self._call("SSCAN")
+
+        for member in list(self._get(key, set())):
+            if match is None or fnmatch.fnmatchcase(member.decode("utf-8"), match):
+                yield member
+
+    async def hget(self, key, field):
+        self._call("HGET")
+        return self._get(key, {}).get(_encode(field))
+
+    async def hset(self, key, field, value):
+        self._call("HSET")
+        self._data.setdefault(_key(key), {})[_encode(field)] = _encode(value)
+
+    async def hdel(self, key, field, *fields):
+        self._call("HDEL")
+        value = self._get(key, {})
+        return sum(value.pop(_encode(x), None) is not None for x in (field, *fields))
+
+    async def hmset_dict(self, key, *args, **kwargs):
+        self._call("HMSET")
+        value = self._data.setdefault(_key(key), {})
+
+        for pairs in (*args, kwargs):
+            value.update({_encode(x): _encode(y) for x, y in pairs.items()})
+
+    async def zadd(self, key, score, member, *pairs):
+        self._call("ZADD")
+        value = self._data.setdefault(_key(key), {})
+
+        pairs = (score, member, *pairs)
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            value[_encode(member)] = float(score)
+
+    async def zrem(self, key, member, *members):
+        self._call("ZREM")
+        value = self._get(key, {})
+        return sum(value.pop(_encode(x), None) is not None for x in (member, *members))
+
+    async def zcard(self, key):
+        self._call("ZCARD")
+        return len(self._get(key, {}))
+
+    def _sorted(self, key):
+        return sorted(self._get(key, {}).items(), key=lambda x: (x[1], x[0]))
+
+    async def zrange(self, key, start=0, stop=-1, withscores=False):
+        self._call("ZRANGE")
+
+        items = self._sorted(key)
+        items = items[start : None if stop == -1 else stop + 1]
+
+        return items if withscores else [x[0] for x in items]
+
+    async def zrangebyscore(self, key, min=float("-inf"), max=float("inf")):
+        self._call("ZRANGEBYSCORE")
+        return [x[0] for x in self._sorted(key) if min <= x[1] <= max]
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+
+        return command
+
+    async def execute(self, *, return_exceptions=False):
+        self._redis.calls["PIPELINE"] += 1
+        return [await getattr(self._redis, x)(*y, **z) for x, y, z in self._commands]
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def _call(self, method, query):
+        self._pool.calls[f"{method} {query.split()[0].upper()}"] += 1
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *args, **kwargs):
+        self._call("execute", query)
+        return "OK"
+
+    async def executemany(self, query, args, **kwargs):
+        self._call("executemany", query)
+
+    async def fetch(self, query, *args, **kwargs):
+        self._call("fetch", query)
+        return []
+
+    async def fetchrow(self, query, *args, **kwargs):
+        self._call("fetchrow", query)
+
+        if query.upper().startswith("INSERT") and "RETURNING *" in query.upper():
+            return dict(zip(COLUMNS[query.split()[2]], args))
+
+        return None
+
+    async def fetchval(self, query, *args, **kwargs):
+        self._call("fetchval", query)
+        return None
+
+    async def copy_records_to_table(self, table, **kwargs):
+        self._pool.calls[f"copy {table}"] += 1
+
+
+class FakePool:
+    def __init__(self):
+        self.calls = Counter()
+        self.in_use = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.calls["acquire"] += 1
+        yield FakeConnection(self)
+
+
+class FakeAPI:
+    def __init__(self, bot_id):
+        self.bot_id = bot_id
+        self.calls = Counter()
+
+        self._ids = itertools.count(int(time.time() * 1000 - 1420070400000) << 22)
+
+    def snowflake(self):
+        return str(next(self._ids))
+
+    def user(self, user_id):
+        return {
+            "id": str(user_id),
+            "username": "user",
+            "discriminator": "0000",
+            "avatar": None,
+            "bot": int(user_id) == self.bot_id,
+        }
+
+    def message(self, channel_id, payload):
+        payload = payload or {}
+
+        return {
+            "id": self.snowflake(),
+            "channel_id": str(channel_id),
+            "type": 0,
+            "content": payload.get("content") or "",
+            "author": self.user(self.bot_id),
+            "attachments": [],
+            "embeds": [payload["embed"]] if payload.get("embed") else [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "timestamp": datetime.utcnow().isoformat(),
+            "edited_timestamp": None,
+        }
+
+    def respond(self, method, path, payload):
+        label = normalize_route(path)
+        parts = path.split("/")
+
+        if method == "GET" and label.endswith("/channels/_id/messages"):
+            return []
+        if method == "POST" and label.endswith("/channels/_id/messages"):
+            return self.message(parts[2], payload)
+        if method == "PATCH" and label.endswith("/channels/_id/messages/_id"):
+            return self.message(parts[2], payload)
+        if method == "GET" and label.endswith("/guilds/_id/members/_id"):
+            return {
+                "user": self.user(parts[-1]),
+                "roles": [],
+                "joined_at": datetime.utcnow().isoformat(),
+                "deaf": False,
+                "mute": False,
+            }
+        if method == "GET" and label.endswith("/users/_id"):
+            return self.user(parts[-1])
+        if method == "GET" and label.endswith("/users/@me/guilds"):
+            return []
+        if method == "POST" and label.endswith("/oauth2/token"):
+            return {
+                "access_token": self.snowflake(),
+                "token_type": "Bearer",
+                "expires_in": 604800,
+                "refresh_token": self.snowflake(),
+                "scope": "identify guilds",
+            }
+        if method == "POST" and label.endswith("/users/@me/channels"):
+            return {
+                "id": self.snowflake(),
+                "type": 1,
+                "recipients": [self.user(payload["recipient_id"])],
+            }
+        if method == "POST" and label.endswith("/guilds/_id/channels"):
+            return {
+                "id": self.snowflake(),
+                "type": payload.get("type", 0),
+                "guild_id": parts[2],
+                "name": payload.get("name"),
+                "position": 0,
+                "permission_overwrites": payload.get("permission_overwrites", []),
+                "topic": payload.get("topic"),
+                "parent_id": payload.get("parent_id"),
+            }
+
+        return None
+
+    def request(self, method, path, payload):
+        self.calls[f"{method} {normalize_route(path)}"] += 1
+        return self.respond(method, path, payload)
+
+
+class FakeHTTPClient(HTTPClient):
+    def __init__(self, bot_id, latency=0, **kwargs):
+        super().__init__(**kwargs)
+        self.api = FakeAPI(bot_id)
+        self.latency = latency
+
+        self._token("fake", bot=True)
+
+    @property
+    def calls(self):
+        return self.api.calls
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = route.url.split("?")[0][len(route.BASE) :]
+        return self.api.request(route.method, path, kwargs.get("json"))
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from collections import Counter, defaultdict, deque
+
+import aioredis
+import asyncpg
+import orjson
+
+from yarl import URL
+
+from benchmarks import models
+from benchmarks.amqp import Broker
+from benchmarks.fakes import FakeAPI
+from benchmarks.replay import report, report_calls
+from benchmarks.rest import API_PREFIX, add_arguments, create_server
+from classes.bot import normalize_route
+from utils.config import Config
+
+ERROR_COLOUR = 0xFF0000
+
+
+class Storm:
+    def __init__(self, args, config, redis, broker, server):
+        self.args = args
+        self.config = config
+        self.redis = redis
+        self.broker = broker
+        self.server = server
+
+        self.bot = models.user_payload(str(server.api.bot_id))
+        self.bot.update({"username": "ModMail", "bot": True})
+
+        self.guilds = []
+        self.users = {}
+        self.dm_channels = {}
+
+        self.pending = defaultdict(deque)
+        self.latencies = defaultdict(list)
+        self.results = Counter()
+
+        self._sequence = 0
+
+    async def _store(self, guild_id, key, value):
+        await self.redis.set(key, orjson.dumps(value))
+        await self.redis.sadd(f"guild_keys:{guild_id}", key)
+
+    async def seed_guild(self, conn):
+        payload = models.guild_payload(self.args.roles, 0, 0)
+        guild_id = payload["id"]
+
+        category = {
+            "id": models.snowflake(),
+            "type": 4,
+            "guild_id": guild_id,
+            "name": "ModMail",
+            "position": 0,
+            "permission_overwrites": [],
+        }
+        member = {
+            "user": self.bot,
+            "roles": [payload["roles"][1]["id"]],
+            "joined_at": models.timestamp(),
+            "deaf": False,
+            "mute": False,
+        }
+
+        for role in payload["roles"]:
+            await self._store(guild_id, f"role:{guild_id}:{role['id']}", role)
+
+        await self._store(guild_id, f"channel:{category['id']}", category)
+        await self._store(guild_id, f"member:{guild_id}:{self.bot['id']}", member)
+
+        for key in ["roles", "channels", "members"]:
+            del payload[key]
+
+        await self.redis.set(f"guild:{guild_id}", orjson.dumps(payload))
+        await self.redis.sadd("guild_keys", f"guild:{guild_id}")
+
+        await conn.execute(
+            "INSERT INTO data VALUES ($1, NULL, $2, '{}', NULL, NULL, NULL, FALSE, '{}', '{}', "
+            "FALSE) ON CONFLICT (guild) DO UPDATE SET category=$2",
+            int(guild_id),
+            int(category["id"]),
+        )
+
+        return guild_id
+
+    async def seed_users(self, conn):
+        for index in range(self.args.users):
+            user = models.user_payload()
+            user["username"] = f"storm {index}"
+
+            dm_channel = models.snowflake()
+            guild_id = self.guilds[index % len(self.guilds)]
+
+            self.users[user["id"]] = (user, dm_channel)
+            self.dm_channels[dm_channel] = user["id"]
+
+            conversation = {"guild": int(guild_id), "channel": None, "active": int(time.time())}
+            await self.redis.set(f"conversation:{user['id']}", orjson.dumps(conversation))
+
+        await conn.executemany(
+            "INSERT INTO account VALUES ($1, FALSE, NULL) ON CONFLICT (identifier) DO UPDATE SET "
+            "confirmation=FALSE",
+            [(int(x),) for x in self.users],
+        )
+
+    async def seed(self):
+        await self.redis.set("bot_user", orjson.dumps(self.bot))
+        await self.redis.set("gateway_shards", 1)
+        await self.redis.set("gateway_started", models.timestamp())
+
+        conn = await asyncpg.connect(
+            database=self.config.POSTGRES_DATABASE,
+            user=self.config.POSTGRES_USERNAME,
+            password=self.config.POSTGRES_PASSWORD,
+            host=self.config.POSTGRES_HOST,
+            port=int(self.config.POSTGRES_PORT),
+        )
+
+        try:
+            with open("schema.sql", "r") as file:
+                await conn.execute(file.read())
+
+            for _ in range(self.args.guilds):
+                self.guilds.append(await self.seed_guild(conn))
+
+            await self.seed_users(conn)
+        finally:
+            await conn.close()
+
+    async def on_request(self, method, path, payload, data):
+        if method != "POST" or not payload:
+            return
+
+        label = normalize_route(path)
+
+        if label == "/guilds/_id/channels":
+            await self._store(data["guild_id"], f"channel:{data['id']}", data)
+            return
+
+        if label != "/channels/_id/messages" or not payload.get("embed"):
+            return
+
+        embed = payload["embed"]
+        channel_id = path.split("/")[2]
+
+        if channel_id in self.dm_channels and embed.get("color") == ERROR_COLOUR:
+            self._finish(self.dm_channels[channel_id], "error")
+        elif embed.get("title") == "Message Received":
+            self._finish(embed["footer"]["text"].split("|")[-1].strip(), None)
+
+    def _finish(self, user_id, result):
+        if not self.pending[user_id]:
+            return
+
+        start, kind = self.pending[user_id].popleft()
+        self.results[result or kind] += 1
+
+        if result is None:
+            self.latencies[kind].append(time.perf_counter() - start)
+
+    def event(self, user_id):
+        user, dm_channel = self.users[user_id]
+        self._sequence += 1
+
+        data = {
+            "id": models.snowflake(),
+            "channel_id": dm_channel,
+            "type": 0,
+            "content": f"Storm message {self._sequence}.",
+            "author": user,
+            "attachments": [],
+            "embeds": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "flags": 0,
+            "timestamp": models.timestamp(),
+            "edited_timestamp": None,
+        }
+
+        return orjson.dumps({"op": 0, "s": self._sequence, "t": "MESSAGE_CREATE", "d": data})
+
+    async def wait_for_workers(self):
+        deadline = time.perf_counter() + self.args.wait
+
+        while self.broker.consumer_count("gateway.recv") < self.args.clusters:
+            if time.perf_counter() >= deadline:
+                raise TimeoutError("The clusters did not connect to the broker in time.")
+
+            await asyncio.sleep(0.5)
+
+    async def run(self):
+        order = [x for x in self.users for _ in range(self.args.messages)]
+        random.shuffle(order)
+
+        sent = set()
+        interval = 1 / self.args.rate if self.args.rate else 0
+        start = time.perf_counter()
+
+        for count, user_id in enumerate(order):
+            if interval:
+                await asyncio.sleep(max(start + count * interval - time.perf_counter(), 0))
+
+            first = user_id not in sent
+            sent.add(user_id)
+
+            self.pending[user_id].append((time.perf_counter(), "new" if first else "existing"))
+            self.broker.publish("gateway.recv", self.event(user_id))
+
+        published = time.perf_counter() - start
+        deadline = time.perf_counter() + self.args.timeout
+
+        while any(self.pending.values()) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+
+        elapsed = time.perf_counter() - start
+        completed = sum(len(x) for x in self.latencies.values())
+
+        self.results["timeout"] += sum(len(x) for x in self.pending.values())
+
+        print(f"Published {len(order)} messages in {published:.3f} seconds.")
+        print(f"Relayed {completed} messages in {elapsed:.3f} seconds.")
+        print(f"Throughput: {completed / elapsed:.1f} messages/sec\n")
+
+        print(
+            f"  {'ticket':<28} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        )
+        for kind, values in sorted(self.latencies.items()):
+            report(kind, values)
+        if completed:
+            report("ALL", [y for x in self.latencies.values() for y in x])
+
+        report_calls("Results", self.results)
+        report_calls("HTTP", self.server.api.calls)
+        report_calls("Rate limited", self.server.ratelimited)
+
+
+async def loadtest(args):
+    config = Config().load()
+
+    if not config.DISCORD_API_URL:
+        raise ValueError("Set DISCORD_API_URL so the bot uses the Discord API stand-in.")
+
+    args.clusters = args.clusters or int(config.BOT_CLUSTERS or 1)
+
+    api_url = URL(config.DISCORD_API_URL)
+    if api_url.path != API_PREFIX:
+        raise ValueError(f"DISCORD_API_URL must end with {API_PREFIX}.")
+
+    redis = await aioredis.create_redis(
+        (config.REDIS_HOST, int(config.REDIS_PORT)), password=config.REDIS_PASSWORD
+    )
+
+    server = create_server(FakeAPI(args.bot_id or int(models.snowflake())), args)
+    broker = Broker()
+
+    storm = Storm(args, config, redis, broker, server)
+    server.hooks.append(storm.on_request)
+
+    await storm.seed()
+    print(f"Seeded {len(storm.guilds)} servers and {len(storm.users)} users.")
+
+    await server.start(api_url.host, api_url.port)
+    await broker.start(config.RABBIT_HOST, int(config.RABBIT_PORT))
+
+    print(
+        f"Waiting for {args.clusters} clusters. Start each one now with "
+        f"python -m benchmarks.worker <cluster> {args.clusters} {server.api.bot_id} loadtest"
+    )
+
+    try:
+        await storm.wait_for_workers()
+        await storm.run()
+    finally:
+        await broker.stop()
+        await server.stop()
+
+        redis.close()
+        await redis.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve stand-ins for RabbitMQ and the Discord API, seed Redis and PostgreSQL, "
+        "and send a storm of direct messages through the bot to measure ticket latency."
+    )
+    parser.add_argument("--guilds", type=int, default=10, help="servers to create")
+    parser.add_argument("--roles", type=int, default=50, help="roles in each server")
+    parser.add_argument("--users", type=int, default=500, help="users sending messages")
+    parser.add_argument("--messages", type=int, default=4, help="messages sent by each user")
+    parser.add_argument(
+        "--rate", type=float, default=10, help="messages per second, 0 for no limit"
+    )
+    parser.add_argument("--clusters", type=int, help="clusters to wait for (BOT_CLUSTERS)")
+    parser.add_argument("--wait", type=float, default=120, help="seconds to wait for clusters")
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="seconds to wait for replies after publishing"
+    )
+    parser.add_argument("--bot-id", type=int, default=0, help="user ID of the bot")
+    add_arguments(parser)
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(loadtest(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
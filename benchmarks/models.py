@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import copy
+import fnmatch
+import gc
+import inspect
+import itertools
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime
+
+import orjson
+
+from discord.role import Role
+
+from benchmarks.fakes import FakeRedis
+from classes.channel import TextChannel
+from classes.guild import Guild
+from classes.member import Member
+from classes.message import Message
+from classes.state import State
+from utils import tools
+
+_ids = itertools.count(int(time.time() * 1000 - 1420070400000) << 22)
+
+
+def snowflake():
+    return str(next(_ids))
+
+
+def timestamp():
+    return datetime.utcnow().isoformat() + "+00:00"
+
+
+def user_payload(user_id=None):
+    return {
+        "id": user_id or snowflake(),
+        "username": "benchmark user",
+        "discriminator": "1234",
+        "avatar": "a_0123456789abcdef0123456789abcdef",
+        "public_flags": 64,
+    }
+
+
+def role_payload(guild_id, role_id=None, position=0):
+    return {
+        "id": role_id or snowflake(),
+        "name": f"role {position}",
+        "color": 3447003,
+        "hoist": position % 10 == 0,
+        "position": position,
+        "permissions": "104320577" if role_id == guild_id else str(1 << (position % 31)),
+        "managed": False,
+        "mentionable": True,
+    }
+
+
+def overwrite_payload(target_id, kind):
+    return {"id": target_id, "type": kind, "allow": "3072", "deny": "2048"}
+
+
+def channel_payload(guild_id, roles, members, position=0):
+    overwrites = [overwrite_payload(guild_id, 0)]
+    overwrites += [overwrite_payload(x["id"], 0) for x in roles[1:41]]
+    overwrites += [overwrite_payload(x["user"]["id"], 1) for x in members[:10]]
+
+    return {
+        "id": snowflake(),
+        "type": 0,
+        "guild_id": guild_id,
+        "name": f"channel-{position}",
+        "position": position,
+        "topic": "A channel used for benchmarking. " * 8,
+        "nsfw": False,
+        "rate_limit_per_user": 0,
+        "parent_id": snowflake(),
+        "last_message_id": snowflake(),
+        "permission_overwrites": overwrites,
+    }
+
+
+def member_payload(roles):
+    return {
+        "user": user_payload(),
+        "roles": [x["id"] for x in roles[1:21]],
+        "nick": "benchmark nickname",
+        "joined_at": timestamp(),
+        "premium_since": timestamp(),
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def guild_payload(role_count, channel_count, member_count):
+    guild_id = snowflake()
+    roles = [role_payload(guild_id, guild_id)]
+    roles += [role_payload(guild_id, position=x) for x in range(1, role_count)]
+    members = [member_payload(roles) for _ in range(member_count)]
+
+    return {
+        "id": guild_id,
+        "name": "Benchmark Guild",
+        "icon": "0123456789abcdef0123456789abcdef",
+        "splash": None,
+        "discovery_splash": None,
+        "banner": None,
+        "description": "A large guild used for benchmarking.",
+        "owner_id": snowflake(),
+        "region": "europe",
+        "afk_channel_id": None,
+        "afk_timeout": 300,
+        "verification_level": 2,
+        "default_message_notifications": 1,
+        "explicit_content_filter": 2,
+        "features": ["COMMUNITY", "NEWS", "BANNER", "INVITE_SPLASH", "VANITY_URL"],
+        "mfa_level": 1,
+        "system_channel_id": snowflake(),
+        "system_channel_flags": 0,
+        "rules_channel_id": snowflake(),
+        "public_updates_channel_id": snowflake(),
+        "max_presences": None,
+        "max_members": 500000,
+        "max_video_channel_users": 25,
+        "premium_tier": 3,
+        "premium_subscription_count": 42,
+        "preferred_locale": "en-US",
+        "member_count": 250000,
+        "unavailable": False,
+        "roles": roles,
+        "channels": [channel_payload(guild_id, roles, members, x) for x in range(channel_count)],
+        "members": members,
+        "emojis": [],
+    }
+
+
+def embed_payload():
+    return {
+        "type": "rich",
+        "title": "New Ticket",
+        "description": "A message sent to the ticket channel. " * 20,
+        "color": 1146986,
+        "timestamp": timestamp(),
+        "author": {"name": "benchmark user#1234", "icon_url": "https://cdn.discordapp.com/a.png"},
+        "footer": {"text": "User ID: 123456789012345678", "icon_url": "https://cdn.x/b.png"},
+        "thumbnail": {"url": "https://cdn.discordapp.com/c.png", "width": 128, "height": 128},
+        "fields": [
+            {"name": f"Field {x}", "value": "Field value " * 5, "inline": x % 2 == 0}
+            for x in range(10)
+        ],
+    }
+
+
+def attachment_payload():
+    attachment_id = snowflake()
+    return {
+        "id": attachment_id,
+        "filename": "screenshot.png",
+        "size": 524288,
+        "url": f"https://cdn.discordapp.com/attachments/1/{attachment_id}/screenshot.png",
+        "proxy_url": f"https://media.discordapp.net/attachments/1/{attachment_id}/screenshot.png",
+        "width": 1920,
+        "height": 1080,
+        "content_type": "image/png",
+    }
+
+
+def message_payload(channel, member):
+    return {
+        "id": snowflake(),
+        "channel_id": channel["id"],
+        "guild_id": channel["guild_id"],
+        "type": 0,
+        "content": "Hello, I need some help with my account. " * 10,
+        "author": member["user"],
+        "member": {x: y for x, y in member.items() if x != "user"},
+        "attachments": [attachment_payload() for _ in range(4)],
+        "embeds": [embed_payload() for _ in range(3)],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "flags": 0,
+        "timestamp": timestamp(),
+        "edited_timestamp": timestamp(),
+    }
+
+
+def create_state():
+    return State(
+        dispatch=None,
+        handlers=None,
+        hooks=None,
+        http=None,
+        loop=None,
+        redis=FakeRedis(),
+        id=int(snowflake()),
+    )
+
+
+def create_benchmarks(args):
+    state = create_state()
+
+    payload = guild_payload(args.roles, args.channels, args.members)
+    guild = Guild(state=state, data=payload)
+    guild._resolved_roles = sorted(
+        Role(guild=guild, state=state, data=tools.upgrade_payload(copy.deepcopy(x)))
+        for x in payload["roles"]
+    )
+
+    channel_data = payload["channels"][0]
+    member_data = payload["members"][0]
+    message_data = message_payload(channel_data, member_data)
+
+    channel = TextChannel(
+        state=state, guild=guild, data=tools.upgrade_payload(copy.deepcopy(channel_data))
+    )
+    member = Member(state=state, guild=guild, data=copy.deepcopy(payload["members"][-1]))
+
+    guild_json = orjson.dumps(payload)
+    channel_json = orjson.dumps(channel_data)
+    message_json = orjson.dumps(message_data)
+
+    def repeat(*args):
+        return lambda number: itertools.repeat(args, number)
+
+    def copies(value):
+        return lambda number: [(copy.deepcopy(value),) for _ in range(number)]
+
+    return [
+        (
+            f"State._loads guild ({len(guild_json) // 1024} KiB)",
+            state._loads,
+            repeat(guild_json, True),
+        ),
+        (
+            f"State._loads channel ({len(channel_json)} B)",
+            state._loads,
+            repeat(channel_json, True),
+        ),
+        (
+            f"State._loads message ({len(message_json)} B)",
+            state._loads,
+            repeat(message_json, True),
+        ),
+        ("tools.upgrade_payload channel", tools.upgrade_payload, copies(channel_data)),
+        ("tools.upgrade_payload role", tools.upgrade_payload, copies(payload["roles"][1])),
+        ("Guild._from_data", guild._from_data, repeat(payload)),
+        ("Guild.__init__", lambda x: Guild(state=state, data=x), repeat(payload)),
+        (
+            "Member.__init__",
+            lambda x: Member(state=state, guild=guild, data=x),
+            repeat(member_data),
+        ),
+        (
+            "Message.__init__",
+            lambda x: Message(state=state, channel=channel, data=x),
+            repeat(message_data),
+        ),
+        ("TextChannel._permissions_for", channel._permissions_for, repeat(member)),
+    ]
+
+
+async def _run(func, inputs):
+    if inspect.iscoroutinefunction(func):
+        start = time.perf_counter()
+        for args in inputs:
+            await func(*args)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    for args in inputs:
+        func(*args)
+    return time.perf_counter() - start
+
+
+async def measure_speed(func, factory, duration, repeat):
+    number = 1
+    while True:
+        elapsed = await _run(func, factory(number))
+        if elapsed >= duration / 10:
+            break
+        number *= 2
+
+    number = max(int(number * duration / elapsed), 1)
+
+    timings = []
+    for _ in range(repeat):
+        timings.append(await _run(func, factory(number)) / number)
+
+    return min(timings)
+
+
+async def measure_memory(func, factory, number):
+    results = []
+    peak = 0
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+
+    for args in factory(number):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+
+        result = func(*args)
+        if inspect.isawaitable(result):
+            result = await result
+
+        peak += tracemalloc.get_traced_memory()[1] - current
+        results.append(result)
+
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks
+
+    return peak / number, blocks / number
+
+
+async def run(args):
+    print(f"  {'benchmark':<40} {'ops/sec':>12} {'us/op':>10} {'peak KiB':>10} {'blocks':>8}")
+
+    for name, func, factory in create_benchmarks(args):
+        if args.filter and not fnmatch.fnmatch(name, args.filter):
+            continue
+
+        seconds = await measure_speed(func, factory, args.duration, args.repeat)
+        peak, blocks = await measure_memory(func, factory, args.memory)
+
+        print(
+            f"  {name:<40} {1 / seconds:>12,.0f} {seconds * 1000000:>10.2f} "
+            f"{peak / 1024:>10.2f} {blocks:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the speed and memory use of State decoding and model construction."
+    )
+    parser.add_argument("--filter", help="only run benchmarks whose name matches this pattern")
+    parser.add_argument("--duration", type=float, default=1, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark")
+    parser.add_argument("--memory", type=int, default=100, help="calls traced for memory use")
+    parser.add_argument("--roles", type=int, default=250, help="roles in the guild fixture")
+    parser.add_argument("--channels", type=int, default=500, help="channels in the guild fixture")
+    parser.add_argument("--members", type=int, default=100, help="members in the guild fixture")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
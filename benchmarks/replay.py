@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from collections import defaultdict
+
+import orjson
+
+from benchmarks.capture import read_capture
+from benchmarks.fakes import FakeHTTPClient, FakePool, FakeRedis
+from classes.bot import EVENT_NAME, ModMail
+from utils import tools
+from utils.cache import Cache
+from utils.config import Config
+from utils.prometheus import Prometheus
+
+
+async def command_prefix(bot, message):
+    prefix = await tools.get_guild_prefix(bot, message.guild)
+    return [f"<@{bot.id}> ", f"<@!{bot.id}> ", prefix]
+
+
+def create_bot(bot_id, redis, pool, http):
+    bot = ModMail(command_prefix=command_prefix, bot_id=bot_id, cluster_id=0, cluster_count=1)
+
+    bot.http = http
+    bot.pool = pool
+    bot.prom = Prometheus(bot)
+    bot._redis = redis
+    bot._cache = Cache.from_config(bot.config)
+
+    bot.setup(1)
+    return bot
+
+
+def track_listeners(bot):
+    tasks = []
+    schedule_event = bot._schedule_event
+
+    def _schedule_event(coro, event_name, *args, **kwargs):
+        task = schedule_event(coro, event_name, *args, **kwargs)
+        tasks.append(task)
+        return task
+
+    async def on_error(event_method, *args, **kwargs):
+        raise
+
+    bot._schedule_event = _schedule_event
+    bot.on_error = on_error
+    return tasks
+
+
+async def wait_listeners(tasks):
+    while tasks:
+        pending = list(tasks)
+        tasks.clear()
+        await asyncio.gather(*pending)
+
+
+def load_capture(path):
+    header = {}
+    keys = []
+    events = []
+
+    for kind, offset, payload in read_capture(path):
+        if kind == b"H":
+            header = orjson.loads(payload)
+        elif kind == b"K":
+            keys.append(orjson.loads(payload))
+        elif kind == b"E":
+            events.append((offset, payload))
+
+    return header, keys, events
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def report(title, values):
+    print(
+        f"  {title:<28} {len(values):>7} "
+        + " ".join(f"{percentile(values, x) * 1000:>9.3f}" for x in [50, 90, 99])
+        + f" {max(values) * 1000:>9.3f}"
+    )
+
+
+def report_calls(title, calls):
+    print(f"\n{title}: {sum(calls.values())} calls")
+    for name, count in calls.most_common(15):
+        print(f"  {name:<60} {count:>7}")
+
+
+async def run_events(args, bot, listeners, events):
+    latencies = defaultdict(list)
+
+    for _ in range(args.repeat):
+        begin = time.perf_counter()
+
+        for offset, body in events:
+            if args.realtime:
+                await asyncio.sleep(max(begin + offset - time.perf_counter(), 0))
+
+            match = EVENT_NAME.search(body)
+            event = match.group(1).decode("utf-8") if match else "UNKNOWN"
+
+            received = time.perf_counter()
+            await bot.receive_message(body)
+            await wait_listeners(listeners)
+            latencies[event].append(time.perf_counter() - received)
+
+    return latencies
+
+
+async def replay(args):
+    header, keys, events = load_capture(args.capture)
+
+    redis = FakeRedis()
+    for entry in keys:
+        redis.load(entry["key"], entry["kind"], entry["value"])
+
+    if await redis.get("gateway_shards") is None:
+        await redis.set("gateway_shards", 1)
+
+    redis.calls.clear()
+
+    pool = FakePool()
+    http = FakeHTTPClient(header.get("bot_id", 0), args.http_latency / 1000)
+    bot = create_bot(header.get("bot_id", 0), redis, pool, http)
+    listeners = track_listeners(bot)
+
+    start = time.perf_counter()
+
+    try:
+        latencies = await run_events(args, bot, listeners, events)
+        handled = time.perf_counter() - start
+
+        pending = asyncio.all_tasks() - {asyncio.current_task()}
+        if pending:
+            await asyncio.wait(pending, timeout=args.drain)
+    finally:
+        await bot.session.close()
+
+    elapsed = time.perf_counter() - start
+    total = sum(len(x) for x in latencies.values())
+
+    print(f"Replayed {total} events in {elapsed:.3f} seconds ({handled:.3f} seconds to handle).")
+    print(f"Throughput: {total / elapsed:.1f} events/sec\n")
+
+    print(f"  {'event':<28} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for event, values in sorted(latencies.items()):
+        report(event, values)
+    report("ALL", [y for x in latencies.values() for y in x])
+
+    report_calls("Redis", redis.calls)
+    report_calls("SQL", pool.calls)
+    report_calls("HTTP", http.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay captured gateway events against in-memory Redis, PostgreSQL and "
+        "Discord stand-ins, and report throughput and latency."
+    )
+    parser.add_argument("capture", help="file written by benchmarks.capture")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times to replay")
+    parser.add_argument(
+        "--realtime", action="store_true", help="keep the recorded spacing between events"
+    )
+    parser.add_argument(
+        "--http-latency", type=float, default=0, help="milliseconds added to each REST call"
+    )
+    parser.add_argument(
+        "--drain", type=float, default=30, help="seconds to wait for background tasks"
+    )
+
+    Config().load()
+    os.environ.setdefault("DEFAULT_PREFIX", "=")
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
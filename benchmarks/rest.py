@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+
+from collections import Counter
+
+import orjson
+
+from aiohttp import web
+
+from benchmarks.fakes import FakeAPI
+from benchmarks.replay import report_calls
+from classes.bot import normalize_route
+
+API_PREFIX = "/api/v7"
+MAJOR_PARAMETERS = ["channels", "guilds", "webhooks"]
+ROUTE_LIMITS = {
+    "POST /channels/_id/messages": (5, 5),
+    "PATCH /channels/_id/messages/_id": (5, 5),
+    "DELETE /channels/_id/messages/_id": (5, 1),
+    "PUT /channels/_id/messages/_id/reactions/_id/@me": (1, 0.25),
+    "POST /guilds/_id/channels": (10, 10),
+}
+
+
+class RateLimits:
+    def __init__(self, limit, window, global_limit, routes=None):
+        self.limit = limit
+        self.window = window
+        self.global_limit = global_limit
+        self.routes = routes or {}
+
+        self._buckets = {}
+        self._global = [0, 0]
+
+    def key(self, method, path):
+        parts = path.split("/")
+        major = parts[2] if len(parts) > 2 and parts[1] in MAJOR_PARAMETERS else ""
+        return f"{method} {normalize_route(path)} {major}"
+
+    def route(self, key):
+        return self.routes.get(key.rsplit(" ", 1)[0], (self.limit, self.window))
+
+    def _hit_global(self, now):
+        if self._global[0] <= now:
+            self._global = [now + 1, 0]
+
+        self._global[1] += 1
+        if self._global[1] > self.global_limit:
+            return self._global[0] - now
+
+        return 0
+
+    def hit(self, key, now):
+        retry = self._hit_global(now)
+        if retry > 0:
+            return True, retry, 0, 0
+
+        limit, window = self.route(key)
+
+        reset, remaining = self._buckets.get(key, (0, 0))
+        if reset <= now:
+            reset, remaining = now + window, limit
+
+        if remaining <= 0:
+            return False, reset - now, 0, reset
+
+        self._buckets[key] = (reset, remaining - 1)
+        return False, 0, remaining - 1, reset
+
+
+class FakeDiscord:
+    def __init__(
+        self, api, latency=0, jitter=0, limit=50, window=1, global_limit=50, routes=ROUTE_LIMITS
+    ):
+        self.api = api
+        self.latency = latency
+        self.jitter = jitter
+        self.ratelimits = RateLimits(limit, window, global_limit, routes)
+        self.ratelimited = Counter()
+        self.hooks = []
+
+        self._runner = None
+
+    async def _read_payload(self, request):
+        if not request.body_exists:
+            return None
+
+        if request.content_type == "application/json":
+            return await request.json(loads=orjson.loads)
+
+        form = await request.post()
+        if "payload_json" in form:
+            return orjson.loads(form["payload_json"])
+
+        return dict(form)
+
+    def _ratelimit_response(self, key, retry, is_global):
+        self.ratelimited["global" if is_global else key] += 1
+
+        headers = {"Retry-After": str(math.ceil(retry)), "Via": "1.1 google"}
+        if is_global:
+            headers["X-RateLimit-Global"] = "true"
+        else:
+            headers.update(self._ratelimit_headers(key, 0, time.time() + retry, retry))
+
+        body = {
+            "message": "You are being rate limited.",
+            "retry_after": int(retry * 1000),
+            "global": is_global,
+        }
+        return web.Response(
+            status=429, body=orjson.dumps(body), content_type="application/json", headers=headers
+        )
+
+    def _ratelimit_headers(self, key, remaining, reset, reset_after):
+        return {
+            "X-RateLimit-Bucket": hashlib.md5(key.rsplit(" ", 1)[0].encode("utf-8")).hexdigest(),
+            "X-RateLimit-Limit": str(self.ratelimits.route(key)[0]),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{reset:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+
+    async def handler(self, request):
+        if not request.path.startswith(API_PREFIX):
+            return web.Response(status=404)
+
+        path = request.path[len(API_PREFIX) :]
+        payload = await self._read_payload(request)
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(self.latency + random.uniform(-1, 1) * self.jitter, 0) / 1000)
+
+        key = self.ratelimits.key(request.method, path)
+        now = time.time()
+
+        is_global, retry, remaining, reset = self.ratelimits.hit(key, now)
+        if retry > 0:
+            return self._ratelimit_response(key, retry, is_global)
+
+        headers = self._ratelimit_headers(key, remaining, reset, reset - now)
+        data = self.api.request(request.method, path, payload)
+
+        for hook in self.hooks:
+            await hook(request.method, path, payload, data)
+
+        if data is None and request.method == "GET":
+            body = {"message": "404: Not Found", "code": 0}
+            return web.Response(
+                status=404, body=orjson.dumps(body), content_type="application/json"
+            )
+        elif data is None:
+            return web.Response(status=204, headers=headers)
+
+        return web.Response(
+            body=orjson.dumps(data), content_type="application/json", headers=headers
+        )
+
+    async def start(self, host, port):
+        self._runner = web.ServerRunner(web.Server(self.handler))
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def create_server(api, args):
+    return FakeDiscord(
+        api,
+        latency=args.latency,
+        jitter=args.jitter,
+        limit=args.limit,
+        window=args.window,
+        global_limit=args.global_limit,
+        routes=None if args.no_route_limits else ROUTE_LIMITS,
+    )
+
+
+async def serve(args):
+    server = create_server(FakeAPI(args.bot_id), args)
+    await server.start(args.host, args.port)
+
+    print(f"Serving the Discord API on http://{args.host}:{args.port}{API_PREFIX}.")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        report_calls("HTTP", server.api.calls)
+        report_calls("Rate limited", server.ratelimited)
+
+        await server.stop()
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to responses")
+    parser.add_argument("--jitter", type=float, default=0, help="random +/- milliseconds")
+    parser.add_argument("--limit", type=int, default=50, help="requests per route bucket")
+    parser.add_argument("--window", type=float, default=1, help="seconds per route bucket")
+    parser.add_argument(
+        "--global-limit", type=int, default=50, help="requests per second across all routes"
+    )
+    parser.add_argument(
+        "--no-route-limits",
+        action="store_true",
+        help="use --limit and --window for message, reaction and channel routes too",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a stand-in for the Discord REST API with rate limits and latency."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=7000, help="port to listen on")
+    parser.add_argument("--bot-id", type=int, default=0, help="user ID of the bot")
+    add_arguments(parser)
+
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
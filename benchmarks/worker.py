@@ -0,0 +1,16 @@
+import runpy
+
+from pathlib import Path
+
+import aio_pika
+
+from benchmarks import amqp
+
+
+def main():
+    aio_pika.connect_robust = amqp.connect_robust
+    runpy.run_path(str(Path(__file__).parent.parent / "worker.py"), run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
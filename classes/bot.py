@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import logging
 import re
 import sys
@@ -13,17 +14,34 @@ import orjson
 from discord.ext import commands
 from discord.ext.commands.core import _CaseInsensitiveDict
 from discord.gateway import DiscordClientWebSocketResponse, DiscordWebSocket
+from discord.http import Route
 from discord.utils import parse_time
 
-from classes.http import HTTPClient
+from classes.http import HTTPClient, RateLimiter
 from classes.misc import Session, Status
 from classes.state import State
 from utils import tools
+from utils.cache import Cache
 from utils.config import Config
+from utils.instrument import TimedPool, TimedRedis
 from utils.prometheus import Prometheus
 
 log = logging.getLogger(__name__)
 
+EVENT_NAME = re.compile(rb'"t":"([A-Z_]+)"')
+ROUTE_BASE = re.compile(r"https:\/\/[a-z\.]+\/api\/v[0-9]+")
+ROUTE_ID = re.compile(r"\/[%A-Z0-9]+")
+ROUTE_PARAM = re.compile(r"\/\{[a-z_]+\}")
+
+
+@functools.lru_cache(maxsize=256)
+def route_label(path):
+    return ROUTE_PARAM.sub("/_id", path.split("?")[0])
+
+
+def normalize_route(url):
+    return ROUTE_ID.sub("/_id", ROUTE_BASE.sub("", url))
+
 
 class ModMail(commands.AutoShardedBot):
     def __init__(self, command_prefix=None, **kwargs):
@@ -56,10 +74,17 @@ class ModMail(commands.AutoShardedBot):
         self._ready = asyncio.Event()
 
         self._redis = None
+        self._cache = None
+        self._redis_sub = None
         self._amqp = None
         self._amqp_channel = None
         self._amqp_queue = None
 
+        self._event_semaphore = None
+        self._event_tails = {}
+
+        self.user_guilds_requests = {}
+
         self.config = Config()
         self.session = aiohttp.ClientSession(loop=self.loop)
         self.http_uri = f"http://{self.config.BOT_API_HOST}:{self.config.BOT_API_PORT}"
@@ -69,8 +94,12 @@ class ModMail(commands.AutoShardedBot):
         self.version = kwargs.get("version")
         self.pool = None
         self.prom = None
+        self.data_cache = Cache(int(self.config.DATA_CACHE_SIZE or 10000), {"data": 300})
 
         self._enabled_events = [
+            "CHANNEL_DELETE",
+            "GUILD_ROLE_CREATE",
+            "GUILD_ROLE_DELETE",
             "MESSAGE_CREATE",
             "MESSAGE_REACTION_ADD",
             "READY",
@@ -137,6 +166,9 @@ class ModMail(commands.AutoShardedBot):
     async def get_guild(self, guild_id):
         return await self._connection._get_guild(guild_id)
 
+    async def get_guilds(self, guild_ids):
+        return await self._connection._get_guilds(guild_ids)
+
     async def get_user(self, user_id):
         return await self._connection.get_user(user_id)
 
@@ -149,9 +181,75 @@ class ModMail(commands.AutoShardedBot):
     async def get_all_members(self):
         pass
 
+    def _event_key(self, msg):
+        data = msg.get("d")
+        if not isinstance(data, dict):
+            return None
+
+        return data.get("channel_id") or data.get("guild_id") or data.get("user_id")
+
+    def _is_dropped(self, msg):
+        match = EVENT_NAME.search(msg)
+        if match is None:
+            return False
+
+        event = match.group(1).decode("utf-8")
+        if event in self._enabled_events:
+            return False
+
+        self.prom.events_dropped.inc({"event": event})
+        return True
+
+    def consume_message(self, message):
+        received = self.loop.time()
+        self.ws._dispatch("socket_raw_receive", message.body)
+
+        if self._is_dropped(message.body):
+            message.ack()
+            return
+
+        try:
+            msg = orjson.loads(message.body)
+        except orjson.JSONDecodeError:
+            log.warning("Received an invalid payload from the gateway.")
+            message.reject()
+            return
+
+        key = self._event_key(msg)
+        previous = self._event_tails.get(key) if key else None
+
+        task = self.loop.create_task(self._process_message(message, msg, key, previous, received))
+        if key:
+            self._event_tails[key] = task
+
+    async def _process_message(self, message, msg, key, previous, received):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+
+            async with self._event_semaphore:
+                self.prom.events_queue_wait.observe({}, self.loop.time() - received)
+                self.prom.events_in_flight.inc({})
+
+                try:
+                    async with message.process(ignore_processed=True):
+                        await self.receive_payload(msg)
+                        message.ack()
+                finally:
+                    self.prom.events_in_flight.dec({})
+        finally:
+            if key and self._event_tails.get(key) is asyncio.current_task():
+                del self._event_tails[key]
+
     async def receive_message(self, msg):
         self.ws._dispatch("socket_raw_receive", msg)
-        msg = orjson.loads(msg)
+
+        if self._is_dropped(msg):
+            return
+
+        await self.receive_payload(orjson.loads(msg))
+
+    async def receive_payload(self, msg):
         self.ws._dispatch("socket_response", msg)
 
         op = msg.get("op")
@@ -159,19 +257,18 @@ class ModMail(commands.AutoShardedBot):
         event = msg.get("t")
         old = msg.get("old")
 
-        if op != self.ws.DISPATCH:
+        if op != self.ws.DISPATCH or event not in self._enabled_events:
             return
 
-        data = tools.upgrade_payload(data)
-
         try:
             func = self.ws._discord_parsers[event]
         except KeyError:
             log.debug(f"Unknown event {event}.")
             return
 
-        if event not in self._enabled_events:
-            return
+        data = tools.upgrade_payload(data)
+
+        start = self.loop.time()
 
         try:
             await func(data, old)
@@ -182,6 +279,16 @@ class ModMail(commands.AutoShardedBot):
                 await self.on_error(event)
             except asyncio.CancelledError:
                 pass
+        finally:
+            self.prom.events_latency.observe({"event": event}, self.loop.time() - start)
+
+    async def subscribe(self, name):
+        channel = await self._redis_sub.subscribe(name)
+        return channel[0]
+
+    async def _data_invalidator(self, channel):
+        async for guild in channel.iter():
+            self.data_cache.invalidate(f"data:{int(guild)}")
 
     async def send_message(self, msg):
         data = orjson.dumps(msg)
@@ -195,25 +302,61 @@ class ModMail(commands.AutoShardedBot):
 
     async def on_http_request_end(self, _session, trace_config_ctx, params):
         elapsed = asyncio.get_event_loop().time() - trace_config_ctx.start
+        route = trace_config_ctx.trace_request_ctx
+
+        if self.http.ratelimiter is not None and route is not None:
+            await self.http.ratelimiter.update(route.bucket, params.response)
 
         if elapsed > 1:
             log.warning(f"{params.method} {params.url} took {round(elapsed, 2)} seconds")
 
-        route = str(params.url)
-        route = re.sub(r"https:\/\/[a-z\.]+\/api\/v[0-9]+", "", route)
-        route = re.sub(r"\/[%A-Z0-9]+", "/_id", route)
-        route = re.sub(r"\?.+", "", route)
+        if route is not None:
+            route = route_label(route.path)
+        else:
+            route = normalize_route(str(params.url.with_query(None)))
 
         if not route.startswith("/"):
             return
 
-        self.prom.http.inc(
-            {
-                "method": params.method,
-                "route": route,
-                "status": str(params.response.status),
-            }
+        labels = {
+            "method": params.method,
+            "route": route,
+            "status": str(params.response.status),
+        }
+
+        self.prom.http.inc(labels)
+        self.prom.http_latency.observe(labels, elapsed)
+
+    def setup(self, shard_count, worker=True):
+        self._connection = State(
+            id=self.id,
+            dispatch=self.dispatch,
+            handlers=self._handlers,
+            hooks=self._hooks,
+            http=self.http,
+            loop=self.loop,
+            redis=self._redis,
+            cache=self._cache,
+            shard_count=shard_count,
         )
+        self._connection._get_client = lambda: self
+
+        self.ws = DiscordWebSocket(socket=None, loop=self.loop)
+        self.ws.token = self.http.token
+        self.ws._connection = self._connection
+        self.ws._discord_parsers = self._connection.parsers
+        self.ws._dispatch = self.dispatch
+        self.ws.call_hooks = self._connection.call_hooks
+
+        if not worker:
+            return
+
+        for extension in self._cogs:
+            try:
+                self.load_extension("cogs." + extension)
+            except Exception:
+                log.error(f"Failed to load extension {extension}.", file=sys.stderr)
+                log.error(traceback.print_exc())
 
     async def start(self, worker=True):
         trace_config = aiohttp.TraceConfig()
@@ -226,6 +369,11 @@ class ModMail(commands.AutoShardedBot):
         )
         self.http._token(self.config.BOT_TOKEN, bot=True)
 
+        if self.config.DISCORD_API_URL:
+            Route.BASE = self.config.DISCORD_API_URL
+
+        self.prom = Prometheus(self)
+
         self.pool = await asyncpg.create_pool(
             database=self.config.POSTGRES_DATABASE,
             user=self.config.POSTGRES_USERNAME,
@@ -235,14 +383,26 @@ class ModMail(commands.AutoShardedBot):
             max_size=10,
             command_timeout=60,
         )
+        self.pool = TimedPool(self.pool, self.prom)
 
         self._redis = await aioredis.create_redis_pool(
             (self.config.REDIS_HOST, int(self.config.REDIS_PORT)),
             password=self.config.REDIS_PASSWORD,
             minsize=5,
             maxsize=10,
+            commands_factory=TimedRedis,
+            loop=self.loop,
+        )
+        self._redis.prom = self.prom
+
+        self._cache = Cache.from_config(self.config)
+
+        self._redis_sub = await aioredis.create_redis(
+            (self.config.REDIS_HOST, int(self.config.REDIS_PORT)),
+            password=self.config.REDIS_PASSWORD,
             loop=self.loop,
         )
+        self.loop.create_task(self._data_invalidator(await self.subscribe("data_invalidate")))
 
         if worker:
             self._amqp = await aio_pika.connect_robust(
@@ -252,42 +412,23 @@ class ModMail(commands.AutoShardedBot):
                 port=int(self.config.RABBIT_PORT),
             )
             self._amqp_channel = await self._amqp.channel()
+            await self._amqp_channel.set_qos(
+                prefetch_count=int(self.config.BOT_PREFETCH_COUNT or 100)
+            )
             self._amqp_queue = await self._amqp_channel.get_queue("gateway.recv")
 
-        self.prom = Prometheus(self)
         await self.prom.start()
 
-        self._connection = State(
-            id=self.id,
-            dispatch=self.dispatch,
-            handlers=self._handlers,
-            hooks=self._hooks,
-            http=self.http,
-            loop=self.loop,
-            redis=self._redis,
-            shard_count=int(await self._redis.get("gateway_shards")),
-        )
-        self._connection._get_client = lambda: self
+        if self.config.RATELIMIT_SHARED in ["true", "True", "1"]:
+            self.http.ratelimiter = RateLimiter(self._redis, self.prom)
 
-        self.ws = DiscordWebSocket(socket=None, loop=self.loop)
-        self.ws.token = self.http.token
-        self.ws._connection = self._connection
-        self.ws._discord_parsers = self._connection.parsers
-        self.ws._dispatch = self.dispatch
-        self.ws.call_hooks = self._connection.call_hooks
+        self.setup(int(await self._redis.get("gateway_shards")), worker)
 
         if not worker:
             return
 
-        for extension in self._cogs:
-            try:
-                self.load_extension("cogs." + extension)
-            except Exception:
-                log.error(f"Failed to load extension {extension}.", file=sys.stderr)
-                log.error(traceback.print_exc())
+        self._event_semaphore = asyncio.Semaphore(int(self.config.BOT_EVENT_CONCURRENCY or 50))
 
         async with self._amqp_queue.iterator() as queue_iter:
             async for message in queue_iter:
-                async with message.process(ignore_processed=True):
-                    await self.receive_message(message.body)
-                    message.ack()
+                self.consume_message(message)
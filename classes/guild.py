@@ -25,6 +25,9 @@ log = logging.getLogger(__name__)
 class Guild(guild.Guild):
     def __init__(self, *, data, state):
         self._state = state
+        self._resolved_roles = None
+        self._resolved_members = {}
+        self._role_keys = None
         self._from_data(data)
 
     def _add_channel(self, channel):
@@ -130,11 +133,17 @@ class Guild(guild.Guild):
             for x in await self._state._members_get_all("guild", key_id=self.id, name="member")
         ]
 
+    async def _roles_data(self):
+        if self._role_keys is not None:
+            return await self._state.get(self._role_keys)
+
+        return await self._state._roles_get_all(self.id)
+
     async def _roles(self):
         return sorted(
             [
                 Role(guild=self, state=self._state, data=tools.upgrade_payload(x))
-                for x in await self._state._members_get_all("guild", key_id=self.id, name="role")
+                for x in await self._roles_data()
             ]
         )
 
@@ -199,7 +208,9 @@ class Guild(guild.Guild):
         return await self._members()
 
     async def get_member(self, user_id):
-        member = await self._state.get(f"member:{self.id}:{user_id}")
+        member = self._resolved_members.get(user_id)
+        if member is None:
+            member = await self._state.get(f"member:{self.id}:{user_id}")
 
         if member:
             return Member(guild=self, state=self._state, data=member)
@@ -215,9 +226,15 @@ class Guild(guild.Guild):
         return await self.fetch_member(self._state.id)
 
     async def roles(self):
-        return await self._roles()
+        if self._resolved_roles is None:
+            self._resolved_roles = await self._roles()
+
+        return list(self._resolved_roles)
 
     async def get_role(self, role_id):
+        if self._resolved_roles is not None or self._role_keys is not None:
+            return utils.get(await self.roles(), id=role_id)
+
         role = await self._state.get(f"role:{self.id}:{role_id}")
 
         if role:
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import time
 
 from discord import http
 from discord.http import Route
@@ -6,7 +8,63 @@ from discord.http import Route
 log = logging.getLogger(__name__)
 
 
+class RateLimiter:
+    def __init__(self, redis, prom):
+        self.redis = redis
+        self.prom = prom
+
+    async def wait(self, bucket):
+        start = time.perf_counter()
+        waited = False
+
+        while True:
+            pipe = self.redis.pipeline()
+            pipe.pttl("ratelimit:global")
+            pipe.pttl(f"ratelimit:{bucket}")
+            delay = max(await pipe.execute())
+
+            if delay <= 0:
+                break
+
+            waited = True
+            await asyncio.sleep(delay / 1000)
+
+        if waited:
+            self.prom.ratelimit_avoided.inc({})
+            self.prom.ratelimit_wait.observe({}, time.perf_counter() - start)
+
+    async def update(self, bucket, response):
+        if response.status == 429:
+            self.prom.ratelimit_hits.inc({})
+
+            if not response.headers.get("Via"):
+                return
+
+            delay = float(response.headers.get("Retry-After", 0))
+            if response.headers.get("X-RateLimit-Global") == "true":
+                bucket = "global"
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            delay = float(response.headers.get("X-RateLimit-Reset-After", 0))
+        else:
+            return
+
+        if delay > 0:
+            await self.redis.set(f"ratelimit:{bucket}", 1, pexpire=int(delay * 1000))
+
+
 class HTTPClient(http.HTTPClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ratelimiter = None
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        if self.ratelimiter is not None:
+            await self.ratelimiter.wait(route.bucket)
+
+        return await super().request(
+            route, files=files, form=form, trace_request_ctx=route, **kwargs
+        )
+
     def request_guild_members(self, guild_id, query, limit=1):
         return self.request(
             Route(
@@ -32,10 +32,28 @@ from utils import tools
 
 log = logging.getLogger(__name__)
 
+DELETE_IF_EQUAL = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
 
 class State:
     def __init__(
-        self, *, dispatch, handlers, hooks, http, loop, redis=None, shard_count=None, id, **options
+        self,
+        *,
+        dispatch,
+        handlers,
+        hooks,
+        http,
+        loop,
+        redis=None,
+        cache=None,
+        shard_count=None,
+        id,
+        **options,
     ):
         self.dispatch = dispatch
         self.handlers = handlers
@@ -43,6 +61,7 @@ class State:
         self.http = http
         self.loop = loop
         self.redis = redis
+        self.cache = cache
         self.shard_count = shard_count
         self.id = id
 
@@ -77,39 +96,86 @@ class State:
             return value
         return orjson.dumps(value).decode("utf-8")
 
+    async def _get(self, key):
+        if self.cache is None or not self.cache.cacheable(key):
+            return await self.redis.get(key)
+
+        value = self.cache.get(key)
+        if value is None:
+            value = await self.redis.get(key)
+            self.cache.set(key, value)
+
+        return value
+
+    async def _mget(self, keys):
+        if self.cache is None:
+            return await self.redis.mget(*keys)
+
+        values = [self.cache.get(x) if self.cache.cacheable(x) else None for x in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+
+        if len(missing) >= 1:
+            for index, value in zip(missing, await self.redis.mget(*[keys[x] for x in missing])):
+                values[index] = value
+                if self.cache.cacheable(keys[index]):
+                    self.cache.set(keys[index], value)
+
+        return values
+
+    def _invalidate(self, *keys):
+        if self.cache is not None:
+            self.cache.invalidate(*keys)
+
     async def delete(self, key):
+        self._invalidate(key)
         return await self.redis.delete(key)
 
+    async def delete_if(self, key, value):
+        self._invalidate(key)
+        return await self.redis.eval(DELETE_IF_EQUAL, keys=[key], args=[self._dumps(value)])
+
+    def _decode(self, key, value, decode=True):
+        value = self._loads(value, decode)
+
+        if isinstance(value, dict):
+            value["_key"] = key
+            value = tools.upgrade_payload(value)
+
+        return value
+
     async def get(self, keys, decode=True):
-        results = []
         if isinstance(keys, (list, tuple)):
             if len(keys) == 0:
                 return []
-            results.extend([self._loads(x, decode) for x in await self.redis.mget(*keys)])
-        else:
-            results.append(self._loads(await self.redis.get(keys), decode))
 
-        for index, value in enumerate(results):
-            if isinstance(value, dict):
-                value["_key"] = keys[index] if isinstance(keys, (list, tuple)) else keys
-                value = tools.upgrade_payload(value)
+            return [x for x in await self.mget(keys, decode) if x is not None]
 
-                results[index] = value
+        return self._decode(keys, await self._get(keys), decode)
 
-        if isinstance(keys, (list, tuple)):
-            return [x for x in results if x is not None]
+    async def mget(self, keys, decode=True):
+        if len(keys) == 0:
+            return []
 
-        return results[0]
+        return [self._decode(x, y, decode) for x, y in zip(keys, await self._mget(keys))]
 
     async def expire(self, key, time):
+        self._invalidate(key)
         return await self.redis.expire(key, time)
 
     async def set(self, key, value=None):
         if isinstance(key, (list, tuple)):
+            self._invalidate(*key[::2])
             return await self.redis.mset(*key)
 
+        self._invalidate(key)
         return await self.redis.set(key, self._dumps(value))
 
+    async def setnx(self, key, value, expire):
+        self._invalidate(key)
+        return await self.redis.set(
+            key, self._dumps(value), expire=expire, exist=self.redis.SET_IF_NOT_EXIST
+        )
+
     async def sadd(self, key, *value):
         return await self.redis.sadd(key, *[self._dumps(x) for x in value])
 
@@ -125,6 +191,32 @@ class State:
     async def scard(self, key):
         return await self.redis.scard(key)
 
+    async def zadd(self, key, score, value):
+        return await self.redis.zadd(key, score, self._dumps(value))
+
+    async def zrem(self, key, *value):
+        return await self.redis.zrem(key, *[self._dumps(x) for x in value])
+
+    async def zrangebyscore(self, key, minimum=float("-inf"), maximum=float("inf"), decode=True):
+        return [
+            self._loads(x, decode) for x in await self.redis.zrangebyscore(key, minimum, maximum)
+        ]
+
+    async def zrange(self, key, start=0, stop=-1, withscores=False, decode=True):
+        if withscores:
+            return [
+                (self._loads(x, decode), y)
+                for x, y in await self.redis.zrange(key, start, stop, withscores=True)
+            ]
+
+        return [self._loads(x, decode) for x in await self.redis.zrange(key, start, stop)]
+
+    async def zcard(self, key):
+        return await self.redis.zcard(key)
+
+    async def publish(self, channel, message):
+        return await self.redis.publish(channel, self._dumps(message))
+
     async def _members(self, key, key_id=None):
         key += "_keys"
 
@@ -160,6 +252,73 @@ class State:
 
         return await self.get(matches)
 
+    async def _members_index_get(self, key, second):
+        index = f"{key}_index"
+
+        if not await self.redis.exists(index):
+            return await self._members_get(key, second=second)
+
+        match = await self.redis.hget(index, str(second))
+        if match is None:
+            return None
+
+        result = await self.get(match.decode("utf-8"))
+        if result is not None:
+            return result
+
+        await self.redis.hdel(index, str(second))
+
+        result = await self._members_get(key, second=second)
+        if result is not None:
+            await self.redis.hset(index, str(second), result["_key"])
+
+        return result
+
+    async def _roles_get_all(self, guild_id, batch=1000):
+        index = f"role_index:{guild_id}"
+        matches = await self.redis.smembers(index)
+
+        if not matches:
+            matches = [
+                x
+                async for x in self.redis.isscan(
+                    f"guild_keys:{guild_id}", match=f"role:{guild_id}:*", count=batch
+                )
+            ]
+
+            if len(matches) >= 1:
+                pipe = self.redis.pipeline()
+                pipe.sadd(index, *matches)
+                pipe.expire(index, 300)
+                await pipe.execute()
+
+        return await self.get([x.decode("utf-8") for x in matches])
+
+    async def build_index(self, key, batch=1000):
+        index = f"{key}_index"
+        temp = f"{index}_build"
+        items = {}
+
+        await self.redis.delete(temp)
+
+        async for match in self.redis.isscan(f"{key}_keys", count=batch):
+            keys = match.decode("utf-8").split(":")
+            if len(keys) < 3:
+                continue
+
+            items[keys[2]] = match
+            if len(items) >= batch:
+                await self.redis.hmset_dict(temp, items)
+                items = {}
+
+        if len(items) >= 1:
+            await self.redis.hmset_dict(temp, items)
+
+        if await self.redis.exists(temp):
+            await self.redis.rename(temp, index)
+        else:
+            await self.redis.delete(index)
+
     def _key_first(self, obj):
         keys = obj["_key"].split(":")
         return int(keys[1])
@@ -250,7 +409,7 @@ class State:
         return User(state=self, data=data)
 
     async def get_user(self, user_id):
-        result = await self._members_get("member", second=user_id)
+        result = await self._members_index_get("member", user_id)
 
         if result:
             return User(state=self, data=result["user"])
@@ -273,6 +432,15 @@ class State:
 
         return None
 
+    async def _get_guilds(self, guild_ids):
+        guilds = []
+        for result in await self.get([f"guild:{x}" for x in guild_ids]):
+            guild = Guild(state=self, data=result)
+            if not guild.unavailable:
+                guilds.append(guild)
+
+        return guilds
+
     def _add_guild(self, guild):
         return
 
@@ -283,7 +451,7 @@ class State:
         return await self._emojis()
 
     async def get_emoji(self, emoji_id):
-        result = await self._members_get("emoji", second=emoji_id)
+        result = await self._members_index_get("emoji", emoji_id)
 
         if result:
             guild = await self._get_guild(self._key_first(result))
@@ -315,8 +483,11 @@ class State:
     def _remove_private_channel(self, channel):
         return
 
-    async def _get_message(self, msg_id):
-        result = await self._members_get("message", second=msg_id)
+    async def _get_message(self, msg_id, channel_id=None):
+        if channel_id:
+            result = await self.get(f"message:{channel_id}:{msg_id}")
+        else:
+            result = await self._members_index_get("message", msg_id)
 
         if result:
             channel = await self.get_channel(self._key_first(result))
@@ -383,7 +554,7 @@ class State:
         self.dispatch("resumed")
 
     async def parse_message_create(self, data, old):
-        channel = await self.get_channel(int(data["channel_id"]))
+        channel, _, _, _ = await self.resolve_message(data)
 
         if not channel and not data.get("guild_id"):
             channel = DMChannel(me=await self.user(), state=self, data={"id": data["channel_id"]})
@@ -451,7 +622,7 @@ class State:
 
         self.dispatch("raw_reaction_add", raw)
 
-        message = await self._get_message(raw.message_id)
+        message = await self._get_message(raw.message_id, raw.channel_id)
         if message:
             reaction = Reaction(
                 message=message, data=data, emoji=await self._upgrade_partial_emoji(emoji)
@@ -465,7 +636,7 @@ class State:
         raw = RawReactionClearEvent(data)
         self.dispatch("raw_reaction_clear", raw)
 
-        message = await self._get_message(raw.message_id)
+        message = await self._get_message(raw.message_id, raw.channel_id)
         if message:
             self.dispatch("reaction_clear", message, None)
 
@@ -479,7 +650,7 @@ class State:
         raw = RawReactionActionEvent(data, emoji, "REACTION_REMOVE")
         self.dispatch("raw_reaction_remove", raw)
 
-        message = await self._get_message(raw.message_id)
+        message = await self._get_message(raw.message_id, raw.channel_id)
         if message:
             reaction = Reaction(
                 message=message, data=data, emoji=await self._upgrade_partial_emoji(emoji)
@@ -499,7 +670,7 @@ class State:
         raw = RawReactionClearEmojiEvent(data, emoji)
         self.dispatch("raw_reaction_clear_emoji", raw)
 
-        message = await self._get_message(raw.message_id)
+        message = await self._get_message(raw.message_id, raw.channel_id)
         if message:
             reaction = Reaction(
                 message=message, data=data, emoji=await self._upgrade_partial_emoji(emoji)
@@ -535,7 +706,7 @@ class State:
         self.dispatch("invite_delete", invite)
 
     async def parse_channel_delete(self, data, old):
-        if old and old["guild_id"]:
+        if old and old.get("guild_id"):
             guild = await self._get_guild(utils._get_as_snowflake(data, "guild_id"))
             if guild:
                 factory, _ = _channel_factory(old["type"])
@@ -687,12 +858,16 @@ class State:
             self.dispatch("member_unban", guild, self.store_user(data["user"]))
 
     async def parse_guild_role_create(self, data, old):
+        await self.redis.delete(f"role_index:{data['guild_id']}")
+
         guild = await self._get_guild(int(data["guild_id"]))
         if guild:
             role = Role(guild=guild, state=self, data=data["role"])
             self.dispatch("guild_role_create", role)
 
     async def parse_guild_role_delete(self, data, old):
+        await self.redis.delete(f"role_index:{data['guild_id']}")
+
         if old:
             guild = await self._get_guild(int(data["guild_id"]))
             if guild:
@@ -799,6 +974,46 @@ class State:
 
         return None
 
+    async def resolve_message(self, data):
+        guild_id = data.get("guild_id")
+        if not guild_id:
+            return await self.get_channel(int(data["channel_id"])), None, None, None
+
+        keys = [
+            f"channel:{data['channel_id']}",
+            f"guild:{guild_id}",
+            f"member:{guild_id}:{data['author']['id']}",
+            f"member:{guild_id}:{self.id}",
+        ]
+
+        values, role_keys = await asyncio.gather(
+            self.mget(keys), self.redis.smembers(f"role_index:{guild_id}")
+        )
+        channel, guild, author, me = values
+
+        if not guild:
+            return None, None, None, None
+
+        guild = Guild(state=self, data=guild)
+        if guild.unavailable:
+            return None, None, None, None
+
+        if role_keys:
+            guild._role_keys = [x.decode("utf-8") for x in role_keys]
+
+        for member in [author, me]:
+            if member:
+                guild._resolved_members[int(member["user"]["id"])] = member
+
+        if channel:
+            factory, _ = _channel_factory(channel["type"])
+            channel = factory(guild=guild, state=self, data=channel)
+
+        author = await guild.get_member(int(data["author"]["id"]))
+        me = await guild.get_member(self.id)
+
+        return channel, guild, author, me
+
     async def get_channel(self, channel_id):
         if not channel_id:
             return None
@@ -50,11 +50,11 @@ class Configuration(commands.Cog):
         msg = await ctx.send(Embed("Setting up..."))
 
         data = await tools.get_data(self.bot, ctx.guild.id)
-        if await ctx.guild.get_channel(data[2]):
+        if await ctx.guild.get_channel(data.category):
             await msg.edit(ErrorEmbed("The bot has already been set up."))
             return
 
-        overwrites = await self._get_overwrites(ctx, data[3])
+        overwrites = await self._get_overwrites(ctx, data.access_roles)
         category = await ctx.guild.create_category(name="ModMail", overwrites=overwrites)
         logging_channel = await ctx.guild.create_text_channel(name="modmail-log", category=category)
 
@@ -66,6 +66,8 @@ class Configuration(commands.Cog):
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await msg.edit(
             Embed(
                 "Premium",
@@ -113,6 +115,8 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute("UPDATE data SET prefix=$1 WHERE guild=$2", prefix, ctx.guild.id)
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await self.bot.state.set(f"prefix:{ctx.guild.id}", "" if prefix is None else prefix)
 
         await ctx.send(
@@ -135,7 +139,7 @@ class Configuration(commands.Cog):
             return
 
         data = await tools.get_data(self.bot, ctx.guild.id)
-        if await ctx.guild.get_channel(data[2]):
+        if await ctx.guild.get_channel(data.category):
             await ctx.send(
                 ErrorEmbed(
                     "A ModMail category already exists. Please delete that category and try again."
@@ -143,7 +147,7 @@ class Configuration(commands.Cog):
             )
             return
 
-        overwrites = await self._get_overwrites(ctx, data[3])
+        overwrites = await self._get_overwrites(ctx, data.access_roles)
         category = await ctx.guild.create_category(name=name, overwrites=overwrites)
 
         async with self.bot.pool.acquire() as conn:
@@ -151,6 +155,8 @@ class Configuration(commands.Cog):
                 "UPDATE data SET category=$1 WHERE guild=$2", category.id, ctx.guild.id
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("Successfully created the category."))
 
     @checks.bot_has_permissions(manage_channels=True, manage_roles=True)
@@ -191,18 +197,21 @@ class Configuration(commands.Cog):
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         data = await tools.get_data(self.bot, ctx.guild.id)
-        category = await ctx.guild.get_channel(data[2])
+        category = await ctx.guild.get_channel(data.category)
 
         if category and roles:
             try:
-                for role in old_data[3]:
+                for role in old_data.access_roles:
                     role = await ctx.guild.get_role(role)
 
                     if role:
                         await category.set_permissions(target=role, overwrite=None)
 
-                for role, permission in (await self._get_overwrites(ctx, data[3])).items():
+                overwrites = await self._get_overwrites(ctx, data.access_roles)
+                for role, permission in overwrites.items():
                     await category.set_permissions(target=role, overwrite=permission)
             except Forbidden:
                 await msg.edit(
@@ -257,6 +266,8 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute("UPDATE data SET pingrole=$1 WHERE guild=$2", role_ids, ctx.guild.id)
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The role(s) are updated successfully."))
 
     @checks.bot_has_permissions(manage_channels=True)
@@ -270,7 +281,7 @@ class Configuration(commands.Cog):
     )
     async def logging(self, ctx):
         data = await tools.get_data(self.bot, ctx.guild.id)
-        channel = await ctx.guild.get_channel(data[4])
+        channel = await ctx.guild.get_channel(data.logging)
 
         if channel:
             try:
@@ -279,14 +290,16 @@ class Configuration(commands.Cog):
                 await ctx.send(ErrorEmbed("Missing permissions to delete the channel."))
                 return
 
-        if data[4]:
+        if data.logging:
             async with self.bot.pool.acquire() as conn:
                 await conn.execute("UPDATE data SET logging=$1 WHERE guild=$2", None, ctx.guild.id)
 
+            await tools.invalidate_data(self.bot, ctx.guild.id)
+
             await ctx.send(Embed("ModMail logs are disabled."))
             return
 
-        category = await ctx.guild.get_channel(data[2])
+        category = await ctx.guild.get_channel(data.category)
         if category is None:
             await ctx.send(
                 ErrorEmbed(
@@ -303,6 +316,8 @@ class Configuration(commands.Cog):
                 "UPDATE data SET logging=$1 WHERE guild=$2", channel.id, ctx.guild.id
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The channel is created successfully."))
 
     @checks.in_database()
@@ -319,6 +334,8 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute("UPDATE data SET welcome=$1 WHERE guild=$2", text, ctx.guild.id)
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The greeting message is set successfully."))
 
     @checks.in_database()
@@ -335,6 +352,8 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute("UPDATE data SET goodbye=$1 WHERE guild=$2", text, ctx.guild.id)
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The closing message is set successfully."))
 
     @checks.in_database()
@@ -352,12 +371,14 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute(
                 "UPDATE data SET loggingplus=$1 WHERE guild=$2",
-                True if data[7] is False else False,
+                True if data.loggingplus is False else False,
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(
-            Embed(f"Advanced logging is {'enabled' if data[7] is False else 'disabled'}.")
+            Embed(f"Advanced logging is {'enabled' if data.loggingplus is False else 'disabled'}.")
         )
 
     @checks.in_database()
@@ -370,12 +391,14 @@ class Configuration(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute(
                 "UPDATE data SET anonymous=$1 WHERE guild=$2",
-                True if data[10] is False else False,
+                True if data.anonymous is False else False,
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(
-            Embed(f"Anonymous messaging is {'enabled' if data[10] is False else 'disabled'}.")
+            Embed(f"Anonymous messaging is {'enabled' if data.anonymous is False else 'disabled'}.")
         )
 
     @checks.in_database()
@@ -386,15 +409,15 @@ class Configuration(commands.Cog):
     )
     async def viewconfig(self, ctx):
         data = await tools.get_data(self.bot, ctx.guild.id)
-        category = await ctx.guild.get_channel(data[2])
-        logging_channel = await ctx.guild.get_channel(data[4])
+        category = await ctx.guild.get_channel(data.category)
+        logging_channel = await ctx.guild.get_channel(data.logging)
 
         access_roles = []
-        for role in data[3]:
+        for role in data.access_roles:
             access_roles.append(f"<@&{role}>")
 
         ping_roles = []
-        for role in data[8]:
+        for role in data.ping_roles:
             if role == -1:
                 ping_roles.append("@here")
             elif role == ctx.guild.id:
@@ -402,11 +425,11 @@ class Configuration(commands.Cog):
             else:
                 ping_roles.append(f"<@&{role}>")
 
-        greeting = data[5]
+        greeting = data.welcome
         if greeting and len(greeting) > 1000:
             greeting = greeting[:997] + "..."
 
-        closing = data[6]
+        closing = data.goodbye
         if closing and len(closing) > 1000:
             closing = closing[:997] + "..."
 
@@ -422,8 +445,8 @@ class Configuration(commands.Cog):
             "Logging",
             "*Not set*" if logging_channel is None else f"<#{logging_channel.id}>",
         )
-        embed.add_field("Advanced Logging", "Enabled" if data[7] is True else "Disabled")
-        embed.add_field("Anonymous Messaging", "Enabled" if data[10] is True else "Disabled")
+        embed.add_field("Advanced Logging", "Enabled" if data.loggingplus is True else "Disabled")
+        embed.add_field("Anonymous Messaging", "Enabled" if data.anonymous is True else "Disabled")
         embed.add_field("Greeting Message", "*Not set*" if greeting is None else greeting, False)
         embed.add_field("Closing message", "*Not set*" if closing is None else closing, False)
 
@@ -1,7 +1,11 @@
 import asyncio
 import copy
-import io
 import logging
+import tempfile
+import time
+import uuid
+
+from datetime import timezone
 
 import discord
 
@@ -39,151 +43,248 @@ class Core(commands.Cog):
         ctx.message.content = message
         await self.bot.cogs["ModMailEvents"].send_mail_mod(ctx.message, ctx.prefix, anon=True)
 
-    async def close_channel(self, ctx, reason, anon: bool = False):
-        await ctx.send(Embed("Closing channel..."))
+    def transcript_entry(self, message):
+        if message.author.bot and (
+            message.author.id != self.bot.id
+            or len(message.embeds) <= 0
+            or message.embeds[0].title not in ["Message Received", "Message Sent"]
+        ):
+            return None
+
+        if not message.author.bot and message.content == "":
+            return None
+
+        if message.author.bot:
+            if not message.embeds[0].author.name:
+                author = " ".join(message.embeds[0].footer.text.split()[:-2])
+                role = "User"
+            elif message.embeds[0].author.name.endswith(" (Anonymous)"):
+                author = message.embeds[0].author.name[:-12]
+                role = "Staff"
+            else:
+                author = message.embeds[0].author.name
+                role = "Staff"
+
+            content = message.embeds[0].description or None
+            attachments = [
+                field.value
+                for field in message.embeds[0].fields
+                if field.name.startswith("Attachment ")
+            ]
+        else:
+            author = str(message.author)
+            role = "Comment"
+            content = message.content
+            attachments = []
 
-        data = await tools.get_data(self.bot, ctx.guild.id)
+        return message.id, author, role, message.created_at, content, attachments
 
-        if data[7] is True:
-            messages = await ctx.channel.history(limit=10000).flatten()
+    def transcript_line(self, entry):
+        _, author, role, created_at, content, attachments = entry
 
-        try:
-            await ctx.channel.delete()
-        except discord.Forbidden:
-            await ctx.send(ErrorEmbed("Missing permissions to delete this channel."))
-            return
+        description = content
+        for attachment in attachments:
+            if not description:
+                description = f"(Attachment: {attachment})"
+            else:
+                description += f" (Attachment: {attachment})"
 
-        embed = ErrorEmbed(
-            "Ticket Closed",
-            reason if reason else "No reason was provided.",
-            timestamp=True,
-        )
-        embed.set_author(
-            str(ctx.author) if anon is False else "Anonymous#0000",
-            ctx.author.avatar_url
-            if anon is False
-            else "https://cdn.discordapp.com/embed/avatars/0.png",
-        )
-        embed.set_footer(f"{ctx.guild.name} | {ctx.guild.id}", ctx.guild.icon_url)
+        return f"[{str(created_at.replace(microsecond=0))}] {author} ({role}): {description}\n"
 
+    async def archive_transcript(self, channel, records, first):
         try:
-            member = await ctx.guild.fetch_member(tools.get_modmail_user(ctx.channel).id)
-        except discord.NotFound:
-            member = None
-        else:
-            dm_channel = tools.get_modmail_channel(self.bot, ctx.channel)
-
-            if data[6]:
-                embed2 = Embed(
-                    "Closing Message",
-                    tools.tag_format(data[6], member),
-                    colour=0xFF4500,
-                    timestamp=True,
+            async with self.bot.pool.acquire() as conn:
+                async with conn.transaction():
+                    if first is True:
+                        await conn.execute("DELETE FROM transcript WHERE ticket=$1", channel.id)
+
+                    await conn.copy_records_to_table(
+                        "transcript",
+                        records=records,
+                        columns=[
+                            "ticket",
+                            "message",
+                            "guild",
+                            "identifier",
+                            "author",
+                            "role",
+                            "created",
+                            "content",
+                            "attachments",
+                        ],
+                    )
+        except Exception:
+            log.exception(f"Failed to archive the transcript of ticket {channel.id}.")
+            return False
+
+        return True
+
+    async def build_transcript(self, channel):
+        start = time.perf_counter()
+
+        user = tools.get_modmail_user(channel).id
+        offsets = []
+        records = []
+        first = True
+        archived = True
+
+        with tempfile.SpooledTemporaryFile(max_size=1048576) as lines:
+            async for message in channel.history(limit=10000):
+                entry = self.transcript_entry(message)
+                if entry is None:
+                    continue
+
+                offsets.append(lines.tell())
+                lines.write(self.transcript_line(entry).encode())
+                records.append(
+                    (
+                        channel.id,
+                        entry[0],
+                        channel.guild.id,
+                        user,
+                        entry[1],
+                        entry[2],
+                        int(entry[3].replace(tzinfo=timezone.utc).timestamp() * 1000),
+                        entry[4],
+                        entry[5],
+                    )
                 )
-                embed2.set_footer(f"{ctx.guild.name} | {ctx.guild.id}", ctx.guild.icon_url)
-                try:
-                    await dm_channel.send(embed2)
-                except discord.Forbidden:
-                    pass
 
+                if len(records) >= 1000:
+                    if archived is True:
+                        archived = await self.archive_transcript(channel, records, first)
+
+                    records = []
+                    first = False
+
+            if archived is True and (len(records) >= 1 or first is True):
+                await self.archive_transcript(channel, records, first)
+
+            transcript = tempfile.SpooledTemporaryFile(max_size=1048576)
+            end = lines.tell()
+
+            for offset in reversed(offsets):
+                lines.seek(offset)
+                transcript.write(lines.read(end - offset))
+                end = offset
+
+        self.bot.prom.transcript_build.observe({}, time.perf_counter() - start)
+        self.bot.prom.transcript_size.observe({}, transcript.tell())
+
+        transcript.seek(0)
+        return transcript
+
+    async def close_channel(self, ctx, reason, anon: bool = False):
+        await ctx.send(Embed("Closing channel..."))
+
+        data = await tools.get_data(self.bot, ctx.guild.id)
+
+        transcript = None
+        if data.loggingplus is True:
+            transcript = await self.build_transcript(ctx.channel)
+
+        try:
             try:
-                await dm_channel.send(embed)
+                await ctx.channel.delete()
             except discord.Forbidden:
-                pass
+                await ctx.send(ErrorEmbed("Missing permissions to delete this channel."))
+                return
 
-        if data[4] is None:
-            return
+            await tools.remove_ticket(
+                self.bot, ctx.guild, tools.get_modmail_user(ctx.channel).id, ctx.channel.id
+            )
 
-        channel = await ctx.guild.get_channel(data[4])
-        if channel is None:
-            return
+            embed = ErrorEmbed(
+                "Ticket Closed",
+                reason if reason else "No reason was provided.",
+                timestamp=True,
+            )
+            embed.set_author(
+                str(ctx.author) if anon is False else "Anonymous#0000",
+                ctx.author.avatar_url
+                if anon is False
+                else "https://cdn.discordapp.com/embed/avatars/0.png",
+            )
+            embed.set_footer(f"{ctx.guild.name} | {ctx.guild.id}", ctx.guild.icon_url)
 
-        if member is None:
             try:
-                member = await self.bot.fetch_user(tools.get_modmail_user(ctx.channel))
+                member = await ctx.guild.fetch_member(tools.get_modmail_user(ctx.channel).id)
             except discord.NotFound:
-                pass
+                member = None
+            else:
+                dm_channel = tools.get_modmail_channel(self.bot, ctx.channel)
+
+                if data.goodbye:
+                    embed2 = Embed(
+                        "Closing Message",
+                        tools.tag_format(data.goodbye, member),
+                        colour=0xFF4500,
+                        timestamp=True,
+                    )
+                    embed2.set_footer(f"{ctx.guild.name} | {ctx.guild.id}", ctx.guild.icon_url)
+                    try:
+                        await dm_channel.send(embed2)
+                    except discord.Forbidden:
+                        pass
 
-        if member:
-            embed.set_footer(f"{member} | {member.id}", member.avatar_url)
-        else:
-            embed.set_footer(
-                "Unknown#0000 | 000000000000000000",
-                "https://cdn.discordapp.com/embed/avatars/0.png",
-            )
-
-        embed.set_author(
-            str(ctx.author) if anon is False else f"{ctx.author} (Anonymous)",
-            ctx.author.avatar_url,
-        )
+                try:
+                    await dm_channel.send(embed)
+                except discord.Forbidden:
+                    pass
 
-        if data[7] is True:
-            history = ""
+            if data.logging is None:
+                return
 
-            for message in messages:
-                if message.author.bot and (
-                    message.author.id != self.bot.id
-                    or len(message.embeds) <= 0
-                    or message.embeds[0].title not in ["Message Received", "Message Sent"]
-                ):
-                    continue
+            channel = await ctx.guild.get_channel(data.logging)
+            if channel is None:
+                return
 
-                if not message.author.bot and message.content == "":
-                    continue
+            if member is None:
+                try:
+                    member = await self.bot.fetch_user(tools.get_modmail_user(ctx.channel))
+                except discord.NotFound:
+                    pass
 
-                if message.author.bot:
-                    if not message.embeds[0].author.name:
-                        author = f"{' '.join(message.embeds[0].footer.text.split()[:-2])} (User)"
-                    elif message.embeds[0].author.name.endswith(" (Anonymous)"):
-                        author = f"{message.embeds[0].author.name[:-12]} (Staff)"
-                    else:
-                        author = f"{message.embeds[0].author.name} (Staff)"
-
-                    description = message.embeds[0].description
-
-                    for attachment in [
-                        field.value
-                        for field in message.embeds[0].fields
-                        if field.name.startswith("Attachment ")
-                    ]:
-                        if not description:
-                            description = f"(Attachment: {attachment})"
-                        else:
-                            description += f" (Attachment: {attachment})"
-                else:
-                    author = f"{message.author} (Comment)"
-                    description = message.content
-
-                history = (
-                    f"[{str(message.created_at.replace(microsecond=0))}] {author}: {description}\n"
-                    + history
+            if member:
+                embed.set_footer(f"{member} | {member.id}", member.avatar_url)
+            else:
+                embed.set_footer(
+                    "Unknown#0000 | 000000000000000000",
+                    "https://cdn.discordapp.com/embed/avatars/0.png",
                 )
 
-            history = io.BytesIO(history.encode())
-
-            file = discord.File(
-                history, f"modmail_log_{tools.get_modmail_user(ctx.channel).id}.txt"
+            embed.set_author(
+                str(ctx.author) if anon is False else f"{ctx.author} (Anonymous)",
+                ctx.author.avatar_url,
             )
 
-            try:
-                msg = await channel.send(embed, file=file)
-            except discord.Forbidden:
-                return
+            if data.loggingplus is True:
+                file = discord.File(
+                    transcript, f"modmail_log_{tools.get_modmail_user(ctx.channel).id}.txt"
+                )
 
-            log_url = msg.attachments[0].url[39:-4]
-            log_url = log_url.replace("modmail_log_", "")
-            log_url = [hex(int(some_id))[2:] for some_id in log_url.split("/")]
-            log_url = f"{self.bot.config.BASE_URI}/logs/{'-'.join(log_url)}"
-            embed.add_field("Message Logs", log_url, False)
+                try:
+                    msg = await channel.send(embed, file=file)
+                except discord.Forbidden:
+                    return
 
-            await asyncio.sleep(0.5)
-            await msg.edit(embed)
-            return
+                log_url = msg.attachments[0].url[39:-4]
+                log_url = log_url.replace("modmail_log_", "")
+                log_url = [hex(int(some_id))[2:] for some_id in log_url.split("/")]
+                log_url = f"{self.bot.config.BASE_URI}/logs/{'-'.join(log_url)}"
+                embed.add_field("Message Logs", log_url, False)
 
-        try:
-            await channel.send(embed)
-        except discord.Forbidden:
-            pass
+                await asyncio.sleep(0.5)
+                await msg.edit(embed)
+                return
+
+            try:
+                await channel.send(embed)
+            except discord.Forbidden:
+                pass
+        finally:
+            if transcript is not None:
+                transcript.close()
 
     @checks.is_modmail_channel()
     @checks.in_database()
@@ -203,24 +304,91 @@ class Core(commands.Cog):
     async def aclose(self, ctx, *, reason: str = None):
         await self.close_channel(ctx, reason, True)
 
-    @checks.in_database()
-    @checks.is_mod()
-    @checks.bot_has_permissions(manage_channels=True)
-    @commands.guild_only()
-    @commands.command(description="Close all of the channels.", usage="closeall [reason]")
-    async def closeall(self, ctx, *, reason: str = None):
-        for channel in await ctx.guild.text_channels():
-            if tools.is_modmail_channel(channel):
+    async def close_all(self, ctx, reason, anon):
+        token = uuid.uuid4().hex
+        if not await self.bot.state.setnx(f"close_job:{ctx.guild.id}", token, 300):
+            await ctx.send(ErrorEmbed("The channels are already being closed."))
+            return
+
+        channels = await tools.get_tickets(self.bot, ctx.guild)
+        if not channels:
+            await self.bot.state.delete_if(f"close_job:{ctx.guild.id}", token)
+            await ctx.send(ErrorEmbed("There are no channels to close."))
+            return
+
+        self.bot.loop.create_task(self.close_all_job(ctx, token, channels, reason, anon))
+
+    async def close_all_job(self, ctx, token, channels, reason, anon):
+        semaphore = asyncio.Semaphore(5)
+        closed = 0
+        cancelled = False
+
+        async def close(channel):
+            nonlocal closed, cancelled
+
+            async with semaphore:
+                if (
+                    cancelled
+                    or await self.bot.state.get(f"close_job:{ctx.guild.id}", False) != token
+                ):
+                    cancelled = True
+                    return
+
                 msg = copy.copy(ctx.message)
                 msg.channel = channel
                 new_ctx = await self.bot.get_context(msg, cls=type(ctx))
-                await self.close_channel(new_ctx, reason)
+
+                try:
+                    await self.close_channel(new_ctx, reason, anon)
+                except Exception as e:
+                    self.bot.dispatch("command_error", new_ctx, commands.CommandInvokeError(e))
+                    return
+
+                closed += 1
+
+        try:
+            progress = await ctx.send(Embed(f"Closing channels... (0/{len(channels)})"))
+        except discord.HTTPException:
+            progress = None
+
+        tasks = [self.bot.loop.create_task(close(channel)) for channel in channels]
+
+        while True:
+            _, pending = await asyncio.wait(tasks, timeout=5)
+
+            if not pending:
+                break
+
+            await self.bot.state.expire(f"close_job:{ctx.guild.id}", 300)
+
+            if progress is not None:
+                try:
+                    await progress.edit(Embed(f"Closing channels... ({closed}/{len(channels)})"))
+                except discord.HTTPException:
+                    progress = None
+
+        await self.bot.state.delete_if(f"close_job:{ctx.guild.id}", token)
+
+        if cancelled:
+            embed = Embed(f"Closing channels is cancelled. {closed}/{len(channels)} are closed.")
+        elif anon:
+            embed = Embed("All channels are successfully closed anonymously.")
+        else:
+            embed = Embed("All channels are successfully closed.")
 
         try:
-            await ctx.send(Embed("All channels are successfully closed."))
+            await ctx.send(embed)
         except discord.HTTPException:
             pass
 
+    @checks.in_database()
+    @checks.is_mod()
+    @checks.bot_has_permissions(manage_channels=True)
+    @commands.guild_only()
+    @commands.command(description="Close all of the channels.", usage="closeall [reason]")
+    async def closeall(self, ctx, *, reason: str = None):
+        await self.close_all(ctx, reason, False)
+
     @checks.in_database()
     @checks.is_mod()
     @checks.bot_has_permissions(manage_channels=True)
@@ -229,17 +397,63 @@ class Core(commands.Cog):
         description="Close all of the channels anonymously.", usage="acloseall [reason]"
     )
     async def acloseall(self, ctx, *, reason: str = None):
-        for channel in await ctx.guild.text_channels():
-            if tools.is_modmail_channel(channel):
-                msg = copy.copy(ctx.message)
-                msg.channel = channel
-                new_ctx = await self.bot.get_context(msg, cls=type(ctx))
-                await self.close_channel(new_ctx, reason, True)
+        await self.close_all(ctx, reason, True)
 
-        try:
-            await ctx.send(Embed("All channels are successfully closed anonymously."))
-        except discord.HTTPException:
-            pass
+    @checks.in_database()
+    @checks.is_mod()
+    @commands.guild_only()
+    @commands.command(
+        description="Cancel closing all of the channels.",
+        usage="cancelcloseall",
+        aliases=["cancelclose"],
+    )
+    async def cancelcloseall(self, ctx):
+        if await self.bot.state.get(f"close_job:{ctx.guild.id}") is None:
+            await ctx.send(ErrorEmbed("The channels are not being closed."))
+            return
+
+        await self.bot.state.delete(f"close_job:{ctx.guild.id}")
+
+        await ctx.send(Embed("Closing channels will be cancelled shortly."))
+
+    @checks.in_database()
+    @checks.is_mod()
+    @commands.guild_only()
+    @commands.command(
+        description="Search the transcripts of closed tickets.",
+        usage="searchlogs <query>",
+        aliases=["searchlog"],
+    )
+    async def searchlogs(self, ctx, *, query: str):
+        async with self.bot.pool.acquire() as conn:
+            res = await conn.fetch(
+                "SELECT identifier, author, role, created, content FROM transcript WHERE guild=$1 "
+                "AND to_tsvector('english', coalesce(content, '')) @@ "
+                "plainto_tsquery('english', $2) ORDER BY created DESC LIMIT 50",
+                ctx.guild.id,
+                query,
+            )
+
+        if not res:
+            await ctx.send(ErrorEmbed("No messages matching the query were found."))
+            return
+
+        all_pages = []
+        for chunk in [res[i : i + 10] for i in range(0, len(res), 10)]:
+            page = Embed(title="Transcript Search")
+
+            for entry in chunk:
+                page.add_field(
+                    f"{entry[1]} ({entry[2]}) - {entry[0]}",
+                    f"<t:{entry[3] // 1000}>: "
+                    + (entry[4][:97] + "..." if len(entry[4]) > 100 else entry[4]),
+                    False,
+                )
+
+            page.set_footer("Use the reactions to flip pages.")
+            all_pages.append(page)
+
+        await tools.create_paginator(self.bot, ctx, all_pages)
 
     @checks.in_database()
     @checks.is_mod()
@@ -250,7 +464,7 @@ class Core(commands.Cog):
         aliases=["block"],
     )
     async def blacklist(self, ctx, *, member: MemberConverter):
-        blacklist = (await tools.get_data(self.bot, ctx.guild.id))[9]
+        blacklist = (await tools.get_data(self.bot, ctx.guild.id)).blacklist
         if member.id in blacklist:
             await ctx.send(ErrorEmbed("The user is already blacklisted."))
             return
@@ -262,6 +476,8 @@ class Core(commands.Cog):
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The user is blacklisted successfully."))
 
     @checks.in_database()
@@ -273,7 +489,7 @@ class Core(commands.Cog):
         aliases=["unblock"],
     )
     async def whitelist(self, ctx, *, member: MemberConverter):
-        blacklist = (await tools.get_data(self.bot, ctx.guild.id))[9]
+        blacklist = (await tools.get_data(self.bot, ctx.guild.id)).blacklist
 
         if member.id not in blacklist:
             await ctx.send(ErrorEmbed("The user is not blacklisted."))
@@ -286,6 +502,8 @@ class Core(commands.Cog):
                 ctx.guild.id,
             )
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The user is whitelisted successfully."))
 
     @checks.in_database()
@@ -296,6 +514,8 @@ class Core(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute("UPDATE data SET blacklist=$1 WHERE guild=$2", [], ctx.guild.id)
 
+        await tools.invalidate_data(self.bot, ctx.guild.id)
+
         await ctx.send(Embed("The blacklist is cleared successfully."))
 
     @checks.in_database()
@@ -303,7 +523,7 @@ class Core(commands.Cog):
     @commands.guild_only()
     @commands.command(description="View the blacklist.", usage="viewblacklist")
     async def viewblacklist(self, ctx):
-        blacklist = (await tools.get_data(self.bot, ctx.guild.id))[9]
+        blacklist = (await tools.get_data(self.bot, ctx.guild.id)).blacklist
         if not blacklist:
             await ctx.send(Embed("No one is blacklisted."))
             return
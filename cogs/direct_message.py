@@ -1,4 +1,3 @@
-import io
 import logging
 import string
 import time
@@ -37,7 +36,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
 
         data = await tools.get_data(self.bot, guild.id)
 
-        category = await guild.get_channel(data[2])
+        category = await guild.get_channel(data.category)
         if not category:
             await message.channel.send(
                 ErrorEmbed(
@@ -46,17 +45,13 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
             )
             return
 
-        if message.author.id in data[9]:
+        if message.author.id in data.blacklist:
             await message.channel.send(
                 ErrorEmbed("That server has blacklisted you from sending a message there.")
             )
             return
 
-        channel = None
-        for text_channel in await guild.text_channels():
-            if tools.is_modmail_channel(text_channel, message.author.id):
-                channel = text_channel
-                break
+        channel = await tools.get_ticket(self.bot, guild, message.author.id)
 
         if channel is None:
             self.bot.prom.tickets.inc({})
@@ -90,7 +85,9 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
                 )
                 return
 
-            log_channel = await guild.get_channel(data[4])
+            await tools.add_ticket(self.bot, guild, message.author.id, channel.id)
+
+            log_channel = await guild.get_channel(data.logging)
             if log_channel:
                 embed = Embed(
                     title="New Ticket",
@@ -129,7 +126,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
             embed.set_footer(f"{message.author} | {message.author.id}", message.author.avatar_url)
 
             roles = []
-            for role in data[8]:
+            for role in data.ping_roles:
                 if role == guild.id:
                     roles.append("@everyone")
                 elif role == -1:
@@ -147,10 +144,10 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
                 )
                 return
 
-            if data[5]:
+            if data.welcome:
                 embed = Embed(
                     "Greeting Message",
-                    tools.tag_format(data[5], message.author),
+                    tools.tag_format(data.welcome, message.author),
                     colour=0xFF4500,
                     timestamp=True,
                 )
@@ -161,13 +158,14 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
         embed = Embed("Message Sent", message.content, colour=0x00FF00, timestamp=True)
         embed.set_footer(f"{guild.name} | {guild.id}", guild.icon_url)
 
-        files = []
-        for file in message.attachments:
-            saved_file = io.BytesIO()
-            await file.save(saved_file)
-            files.append(discord.File(saved_file, file.filename))
+        files = await tools.download_attachments(self.bot, message.attachments)
 
-        dm_message = await message.channel.send(embed, files=files)
+        tools.count_uploaded(self.bot, files)
+        try:
+            dm_message = await message.channel.send(embed, files=files)
+        except discord.HTTPException:
+            tools.close_attachments(files)
+            raise
 
         embed.title = "Message Received"
         embed.set_footer(
@@ -180,9 +178,11 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
         ):
             embed.add_field(f"Attachment {count}", attachment, False)
 
-        for file in files:
-            file.reset()
+        if tools.forward_attachments(self.bot):
+            tools.close_attachments(files)
+            files = []
 
+        tools.count_uploaded(self.bot, files)
         try:
             await channel.send(embed, files=files)
         except discord.Forbidden:
@@ -190,6 +190,11 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
             await message.channel.send(
                 ErrorEmbed("The bot is missing permissions. Please contact an admin on the server.")
             )
+            return
+        finally:
+            tools.close_attachments(files)
+
+        await tools.set_conversation(self.bot, message.author.id, guild.id, channel.id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
@@ -220,11 +225,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
                 for reaction in ["✅", "🔁", "❌"]:
                     await msg.remove_reaction(reaction, self.bot.user)
 
-            await self.bot.state.delete(f"reaction_menu:{channel.id}:{msg.id}")
-            await self.bot.state.srem(
-                "reaction_menu_keys",
-                f"reaction_menu:{channel.id}:{msg.id}",
-            )
+            await tools.remove_reaction_menu(self.bot, channel.id, msg.id)
             return
 
         numbers = ["1⃣", "2⃣", "3⃣", "4⃣", "5⃣", "6⃣", "7⃣", "8⃣", "9⃣", "🔟"]
@@ -249,11 +250,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
                 message = Message(state=self.bot.state, channel=channel, data=menu["data"]["msg"])
                 await self.send_mail(message, guild)
 
-                await self.bot.state.delete(f"reaction_menu:{channel.id}:{msg.id}")
-                await self.bot.state.srem(
-                    "reaction_menu_keys",
-                    f"reaction_menu:{channel.id}:{msg.id}",
-                )
+                await tools.remove_reaction_menu(self.bot, channel.id, msg.id)
                 return
 
             if payload.emoji.name == "◀️" and page > 0:
@@ -264,7 +261,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
 
                 menu["data"]["page"] = page
                 menu["end"] = int(time.time()) + 180
-                await self.bot.state.set(f"reaction_menu:{channel.id}:{msg.id}", menu)
+                await tools.set_reaction_menu(self.bot, channel.id, msg.id, menu)
 
                 for reaction in numbers[: len(new_page.fields)]:
                     await msg.add_reaction(reaction)
@@ -277,7 +274,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
 
                 menu["data"]["page"] = page
                 menu["end"] = int(time.time()) + 180
-                await self.bot.state.set(f"reaction_menu:{channel.id}:{msg.id}", menu)
+                await tools.set_reaction_menu(self.bot, channel.id, msg.id, menu)
 
                 for reaction in numbers[len(new_page.fields) :]:
                     try:
@@ -298,16 +295,7 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
             await message.channel.send(ErrorEmbed("You are banned from this bot."))
             return
 
-        guild = None
-        async for msg in message.channel.history(limit=30):
-            if (
-                msg.author.id == self.bot.id
-                and len(msg.embeds) > 0
-                and msg.embeds[0].title in ["Message Received", "Message Sent"]
-            ):
-                guild = msg.embeds[0].footer.text.split()[-1]
-                guild = await self.bot.get_guild(int(guild))
-                break
+        guild = await tools.get_conversation_guild(self.bot, message.author.id, message.channel)
 
         settings = await tools.get_user_settings(self.bot, message.author.id)
         confirmation = True if settings is None or settings[0] is True else False
@@ -329,8 +317,10 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
             await msg.add_reaction("🔁")
             await msg.add_reaction("❌")
 
-            await self.bot.state.set(
-                f"reaction_menu:{msg.channel.id}:{msg.id}",
+            await tools.set_reaction_menu(
+                self.bot,
+                msg.channel.id,
+                msg.id,
                 {
                     "kind": "confirmation",
                     "end": int(time.time()) + 180,
@@ -340,10 +330,6 @@ class DirectMessageEvents(commands.Cog, name="Direct Message"):
                     },
                 },
             )
-            await self.bot.state.sadd(
-                "reaction_menu_keys",
-                f"reaction_menu:{msg.channel.id}:{msg.id}",
-            )
         elif guild:
             await self.send_mail(message, guild)
         else:
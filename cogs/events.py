@@ -5,6 +5,7 @@ import discord
 
 from discord.ext import commands
 
+from classes.channel import TextChannel
 from classes.context import Context
 from classes.embed import Embed, ErrorEmbed
 from utils import tools
@@ -20,6 +21,15 @@ class Events(commands.Cog):
     async def on_ready(self):
         pass
 
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        if not isinstance(channel, TextChannel) or not tools.is_modmail_channel(channel):
+            return
+
+        await tools.remove_ticket(
+            self.bot, channel.guild, tools.get_modmail_user(channel).id, channel.id
+        )
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
         if payload.user_id == self.bot.id:
@@ -45,11 +55,7 @@ class Events(commands.Cog):
                     except discord.NotFound:
                         pass
 
-            await self.bot.state.delete(f"reaction_menu:{channel.id}:{message.id}")
-            await self.bot.state.srem(
-                "reaction_menu_keys",
-                f"reaction_menu:{channel.id}:{message.id}",
-            )
+            await tools.remove_reaction_menu(self.bot, channel.id, message.id)
             return
 
         page = menu["data"]["page"]
@@ -74,7 +80,7 @@ class Events(commands.Cog):
 
         menu["data"]["page"] = page
         menu["end"] = int(time.time()) + 180
-        await self.bot.state.set(f"reaction_menu:{channel.id}:{message.id}", menu)
+        await tools.set_reaction_menu(self.bot, channel.id, message.id, menu)
 
     @commands.Cog.listener()
     async def on_message(self, message):
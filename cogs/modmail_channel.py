@@ -1,4 +1,3 @@
-import io
 import logging
 
 import discord
@@ -32,7 +31,7 @@ class ModMailEvents(commands.Cog):
             await message.channel.send(ErrorEmbed("You are banned from this bot."))
             return
 
-        if (await tools.get_data(self.bot, message.guild.id))[10] is True:
+        if (await tools.get_data(self.bot, message.guild.id)).anonymous is True:
             await self.send_mail_mod(message, prefix, anon=True)
             return
 
@@ -44,7 +43,7 @@ class ModMailEvents(commands.Cog):
         data = await tools.get_data(self.bot, message.guild.id)
         user = tools.get_modmail_user(message.channel)
 
-        if user.id in data[9]:
+        if user.id in data.blacklist:
             await message.channel.send(
                 ErrorEmbed(
                     "That user is blacklisted from sending a message here. You need to whitelist "
@@ -75,17 +74,15 @@ class ModMailEvents(commands.Cog):
         )
         embed.set_footer(f"{message.guild.name} | {message.guild.id}", message.guild.icon_url)
 
-        files = []
-        for file in message.attachments:
-            saved_file = io.BytesIO()
-            await file.save(saved_file)
-            files.append(discord.File(saved_file, file.filename))
+        files = await tools.download_attachments(self.bot, message.attachments)
 
         dm_channel = tools.get_modmail_channel(self.bot, message.channel)
 
+        tools.count_uploaded(self.bot, files)
         try:
             dm_message = await dm_channel.send(embed, files=files)
         except discord.Forbidden:
+            tools.close_attachments(files)
             await message.channel.send(
                 ErrorEmbed(
                     "The message could not be sent. The user might have disabled Direct Messages."
@@ -93,6 +90,8 @@ class ModMailEvents(commands.Cog):
             )
             return
 
+        await tools.set_conversation(self.bot, user.id, message.guild.id, message.channel.id)
+
         embed.title = "Message Sent"
         embed.set_author(
             str(message.author) if anon is False else f"{message.author} (Anonymous)",
@@ -105,10 +104,15 @@ class ModMailEvents(commands.Cog):
         ):
             embed.add_field(f"Attachment {count}", attachment, False)
 
-        for file in files:
-            file.reset()
+        if tools.forward_attachments(self.bot):
+            tools.close_attachments(files)
+            files = []
 
-        await message.channel.send(embed, files=files)
+        tools.count_uploaded(self.bot, files)
+        try:
+            await message.channel.send(embed, files=files)
+        finally:
+            tools.close_attachments(files)
 
         try:
             await message.delete()
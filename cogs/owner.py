@@ -138,6 +138,8 @@ class Owner(commands.Cog):
             timestamp = int(expiry.replace(tzinfo=timezone.utc).timestamp() * 1000)
             await conn.execute("INSERT INTO premium VALUES ($1, $2, $3)", user.id, [], timestamp)
 
+        await tools.schedule_timer(self.bot, f"premium:{user.id}", timestamp / 1000)
+
         await ctx.send(Embed("Successfully assigned that user premium temporarily."))
 
     @checks.is_owner()
@@ -151,6 +153,8 @@ class Owner(commands.Cog):
 
             await conn.execute("DELETE FROM premium WHERE identifier=$1", user.id)
 
+        await tools.cancel_timer(self.bot, f"premium:{user.id}")
+
         await ctx.send(Embed("Successfully removed that user's premium."))
 
     @checks.is_owner()
@@ -1,5 +1,6 @@
 import asyncio
 import json
+import logging
 import os
 import signal
 import sys
@@ -21,6 +22,9 @@ from utils import tools
 from utils.config import Config
 
 VERSION = "3.1.0"
+TIMER_RETRY = 60
+
+log = logging.getLogger(__name__)
 
 
 class Instance:
@@ -93,29 +97,50 @@ class Scheduler:
         self.loop = loop
         self.bot = bot
         self.session = aiohttp.ClientSession()
+        self._timer_event = asyncio.Event()
 
-    async def premium_updater(self):
-        while True:
-            async with self.bot.pool.acquire() as conn:
-                premium = await conn.fetch(
-                    "SELECT identifier, guild FROM premium WHERE expiry IS NOT NULL AND expiry<$1",
+    async def expire_premium(self, timer_key=None):
+        async with self.bot.pool.acquire() as conn:
+            async with conn.transaction():
+                expired, guilds = await conn.fetchrow(
+                    "WITH expired AS (DELETE FROM premium WHERE expiry IS NOT NULL AND "
+                    "expiry<=$1 RETURNING guild) SELECT (SELECT count(*) FROM expired), "
+                    "array(SELECT DISTINCT unnest(guild) FROM expired)",
                     int(datetime.utcnow().timestamp() * 1000),
                 )
 
-                for row in premium:
-                    for guild in row[1]:
-                        await conn.execute(
-                            "UPDATE data SET welcome=$1, goodbye=$2, loggingplus=$3 WHERE guild=$4",
-                            None,
-                            None,
-                            False,
-                            guild,
-                        )
-                        await conn.execute("DELETE FROM snippet WHERE guild=$1", guild)
+                if len(guilds) >= 1:
+                    await conn.execute(
+                        "UPDATE data SET welcome=$1, goodbye=$2, loggingplus=$3 WHERE "
+                        "guild=any($4::bigint[])",
+                        None,
+                        None,
+                        False,
+                        guilds,
+                    )
+                    await conn.execute("DELETE FROM snippet WHERE guild=any($1::bigint[])", guilds)
+
+        for guild in guilds:
+            await tools.invalidate_data(self.bot, guild)
+
+        self.bot.prom.premium_expired.add({}, expired)
+
+        if timer_key is not None:
+            await tools.cancel_timer(self.bot, timer_key)
 
-                    await conn.execute("DELETE FROM premium WHERE identifier=$1", row[0])
+    async def refresh_token(self, timer_key):
+        await tools.cancel_timer(self.bot, timer_key)
 
-            await asyncio.sleep(60)
+        user = int(timer_key.split(":")[1])
+        active = await self.bot.state.get(f"user_guilds:{user}") is not None
+        await tools.refresh_user_token(self.bot, user, active)
+
+    async def index_updater(self):
+        while True:
+            for key in ["member", "emoji", "message"]:
+                await self.bot.state.build_index(key)
+
+            await asyncio.sleep(300)
 
     async def bot_stats_updater(self):
         while True:
@@ -160,53 +185,122 @@ class Scheduler:
 
             await asyncio.sleep(900)
 
-    async def cleanup(self):
-        while True:
-            for menu_key in await self.bot.state.smembers("reaction_menu_keys"):
-                menu = await self.bot.state.get(menu_key)
+    async def cleanup_menu(self, menu_key):
+        menu = await self.bot.state.get(menu_key)
+
+        if menu is None:
+            await tools.cancel_timer(self.bot, menu_key)
+            return
 
-                if menu is None:
-                    await self.bot.state.srem("reaction_menu_keys", menu_key)
-                    continue
+        if menu["end"] > int(time.time()):
+            await self.bot.state.zadd("timers", menu["end"], menu_key)
+            return
 
-                if menu["end"] > int(time.time()):
-                    continue
+        channel = tools.create_fake_channel(self.bot, menu_key.split(":")[1])
+        message = tools.create_fake_message(self.bot, channel, menu_key.split(":")[2])
 
-                channel = tools.create_fake_channel(self.bot, menu_key.split(":")[1])
-                message = tools.create_fake_message(self.bot, channel, menu_key.split(":")[2])
+        emojis = []
 
+        if menu["kind"] == "paginator":
+            try:
+                await message.clear_reactions()
+            except discord.Forbidden:
+                emojis = ["⏮️", "◀️", "⏹️", "▶️", "⏭️"]
+            except discord.HTTPException:
+                pass
+        elif menu["kind"] == "confirmation":
+            emojis = ["✅", "🔁", "❌"]
+            try:
+                await message.edit(ErrorEmbed("Time out. You did not choose anything."))
+            except discord.HTTPException:
+                emojis = []
+        elif menu["kind"] == "selection":
+            emojis = ["1⃣", "2⃣", "3⃣", "4⃣", "5⃣", "6⃣", "7⃣", "8⃣", "9⃣", "🔟", "◀️", "▶️"]
+            try:
+                await message.edit(ErrorEmbed("Time out. You did not choose anything."))
+            except discord.HTTPException:
                 emojis = []
 
-                if menu["kind"] == "paginator":
-                    try:
-                        await message.clear_reactions()
-                    except discord.Forbidden:
-                        emojis = ["⏮️", "◀️", "⏹️", "▶️", "⏭️"]
-                    except discord.HTTPException:
-                        pass
-                elif menu["kind"] == "confirmation":
-                    emojis = ["✅", "🔁", "❌"]
-                    try:
-                        await message.edit(ErrorEmbed("Time out. You did not choose anything."))
-                    except discord.HTTPException:
-                        emojis = []
-                elif menu["kind"] == "selection":
-                    emojis = ["1⃣", "2⃣", "3⃣", "4⃣", "5⃣", "6⃣", "7⃣", "8⃣", "9⃣", "🔟", "◀️", "▶️"]
-                    try:
-                        await message.edit(ErrorEmbed("Time out. You did not choose anything."))
-                    except discord.HTTPException:
-                        emojis = []
-
-                await self.bot.state.delete(menu_key)
-                await self.bot.state.srem("reaction_menu_keys", menu_key)
-
-                for emoji in emojis:
-                    try:
-                        await message.remove_reaction(emoji, self.bot.user)
-                    except discord.HTTPException:
-                        pass
-
-            await asyncio.sleep(30)
+        await tools.remove_reaction_menu(self.bot, channel.id, message.id)
+
+        for emoji in emojis:
+            try:
+                await message.remove_reaction(emoji, self.bot.user)
+            except discord.HTTPException:
+                pass
+
+    async def fire_timer(self, timer_key):
+        handlers = {
+            "reaction_menu": self.cleanup_menu,
+            "premium": self.expire_premium,
+            "user_token": self.refresh_token,
+        }
+
+        kind = timer_key.split(":")[0]
+        if kind not in handlers:
+            await tools.cancel_timer(self.bot, timer_key)
+            return
+
+        await handlers[kind](timer_key)
+        self.bot.prom.timers_fired.inc({"kind": kind})
+
+    async def timer_waker(self):
+        channel = await self.bot.subscribe("timers")
+        async for _ in channel.iter():
+            self._timer_event.set()
+
+    async def timers(self):
+        semaphore = asyncio.Semaphore(10)
+
+        async def fire(timer_key):
+            async with semaphore:
+                try:
+                    await self.fire_timer(timer_key)
+                except Exception:
+                    log.exception(f"Failed to fire {timer_key}, retrying in {TIMER_RETRY} seconds.")
+                    await self.bot.state.zadd("timers", time.time() + TIMER_RETRY, timer_key)
+
+        while True:
+            self._timer_event.clear()
+
+            now = time.time()
+            head = await self.bot.state.zrange("timers", 0, 0, True, False)
+            self.bot.prom.timers_pending.set({}, await self.bot.state.zcard("timers"))
+
+            if head and head[0][1] <= now:
+                timer_keys = await self.bot.state.zrangebyscore("timers", maximum=now, decode=False)
+                self.bot.prom.timers_lag.observe({}, now - head[0][1])
+
+                await asyncio.gather(*[fire(x) for x in timer_keys], return_exceptions=True)
+                continue
+
+            try:
+                await asyncio.wait_for(
+                    self._timer_event.wait(), min(head[0][1] - now, 300) if head else 300
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def migrate_timers(self):
+        for menu_key in await self.bot.state.smembers("reaction_menu_keys", False):
+            menu = await self.bot.state.get(menu_key)
+            if menu is not None:
+                await self.bot.state.zadd("timers", menu["end"], menu_key)
+
+        menus = await self.bot.state.zrange("reaction_menu_expiry", 0, -1, True, False)
+        for menu_key, end in menus:
+            await self.bot.state.zadd("timers", end, menu_key)
+
+        await self.bot.state.delete("reaction_menu_keys")
+        await self.bot.state.delete("reaction_menu_expiry")
+
+        async with self.bot.pool.acquire() as conn:
+            premium = await conn.fetch(
+                "SELECT identifier, expiry FROM premium WHERE expiry IS NOT NULL"
+            )
+
+        for row in premium:
+            await self.bot.state.zadd("timers", row[1] / 1000, f"premium:{row[0]}")
 
     async def launch(self):
         async with self.bot.pool.acquire() as conn:
@@ -224,11 +318,14 @@ class Scheduler:
         if len([x[0] for x in bans if x[1] == 1]) >= 1:
             await self.bot.state.sadd("banned_guilds", *[x[0] for x in bans if x[1] == 1])
 
+        await self.migrate_timers()
+
         if config.ENVIRONMENT == "production":
             self.loop.create_task(self.bot_stats_updater())
 
-        self.loop.create_task(self.premium_updater())
-        self.loop.create_task(self.cleanup())
+        self.loop.create_task(self.index_updater())
+        self.loop.create_task(self.timer_waker())
+        self.loop.create_task(self.timers())
 
 
 class Main:
@@ -260,6 +357,8 @@ class Main:
                 body["token"],
             )
 
+        await self.bot.state.delete(f"user_guilds:{body['id']}")
+
         user_select = await self.bot.state.get(f"user_select:{body['id']}")
         if not user_select:
             return
@@ -304,12 +403,8 @@ class Main:
         self.bot.state.id = self.bot.id
 
         async with self.bot.pool.acquire() as conn:
-            exists = await conn.fetchrow(
-                "SELECT EXISTS (SELECT relname FROM pg_class WHERE relname = 'data')"
-            )
-            if exists[0] is False:
-                with open("schema.sql", "r") as file:
-                    await conn.execute(file.read())
+            with open("schema.sql", "r") as file:
+                await conn.execute(file.read())
 
         for i in range(int(config.BOT_CLUSTERS)):
             self.instances.append(Instance(i + 1, loop=self.loop, main=self))
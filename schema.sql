@@ -1,4 +1,4 @@
-CREATE TABLE public.data
+CREATE TABLE IF NOT EXISTS public.data
 (
     guild       bigint   NOT NULL,
     prefix      text,
@@ -14,7 +14,7 @@ CREATE TABLE public.data
     PRIMARY KEY (guild)
 );
 
-CREATE TABLE public.snippet
+CREATE TABLE IF NOT EXISTS public.snippet
 (
     guild   bigint NOT NULL,
     name    text   NOT NULL,
@@ -22,7 +22,7 @@ CREATE TABLE public.snippet
     PRIMARY KEY (guild, name)
 );
 
-CREATE TABLE public.premium
+CREATE TABLE IF NOT EXISTS public.premium
 (
     identifier bigint   NOT NULL,
     guild      bigint[] NOT NULL,
@@ -30,17 +30,36 @@ CREATE TABLE public.premium
     PRIMARY KEY (identifier)
 );
 
-CREATE TABLE public.ban
+CREATE TABLE IF NOT EXISTS public.ban
 (
     identifier bigint  NOT NULL,
     category   integer NOT NULL,
     PRIMARY KEY (identifier, category)
 );
 
-CREATE TABLE public.account
+CREATE TABLE IF NOT EXISTS public.account
 (
     identifier   bigint  NOT NULL,
     confirmation boolean NOT NULL,
     token        text,
     PRIMARY KEY (identifier)
 );
+
+CREATE TABLE IF NOT EXISTS public.transcript
+(
+    ticket      bigint NOT NULL,
+    message     bigint NOT NULL,
+    guild       bigint NOT NULL,
+    identifier  bigint NOT NULL,
+    author      text   NOT NULL,
+    role        text   NOT NULL,
+    created     bigint NOT NULL,
+    content     text,
+    attachments text[] NOT NULL,
+    PRIMARY KEY (ticket, message)
+);
+
+CREATE INDEX IF NOT EXISTS transcript_guild_identifier_idx ON public.transcript (guild, identifier);
+
+CREATE INDEX IF NOT EXISTS transcript_content_idx ON public.transcript
+    USING gin (to_tsvector('english', coalesce(content, '')));
@@ -0,0 +1,79 @@
+import logging
+import time
+
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class Cache:
+    def __init__(self, max_size, ttls):
+        self.max_size = max_size
+        self.ttls = ttls
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._items = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.STATE_CACHE_SIZE or int(config.STATE_CACHE_SIZE) <= 0:
+            return None
+
+        ttls = {}
+        for entry in (config.STATE_CACHE_TTL or "").split(","):
+            if ":" not in entry:
+                continue
+
+            prefix, ttl = entry.strip().rsplit(":", 1)
+            ttls[prefix] = float(ttl)
+
+        return cls(int(config.STATE_CACHE_SIZE), ttls)
+
+    def __len__(self):
+        return len(self._items)
+
+    def ttl_for(self, key):
+        return self.ttls.get(key.split(":", 1)[0])
+
+    def cacheable(self, key):
+        return isinstance(key, str) and self.ttl_for(key) is not None
+
+    def get(self, key):
+        try:
+            value, expiry = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expiry <= time.monotonic():
+            del self._items[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        ttl = self.ttl_for(key)
+        if ttl is None or value is None:
+            return
+
+        self._items[key] = (value, time.monotonic() + ttl)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
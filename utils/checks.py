@@ -34,10 +34,7 @@ def is_admin():
 
 def in_database():
     async def predicate(ctx):
-        async with ctx.bot.pool.acquire() as conn:
-            res = await conn.fetchrow("SELECT category FROM data WHERE guild=$1", ctx.guild.id)
-
-        if not res or not res[0]:
+        if not (await tools.get_data(ctx.bot, ctx.guild.id)).category:
             await ctx.send(
                 ErrorEmbed(f"Your server has not been set up yet. Use `{ctx.prefix}setup` first.")
             )
@@ -115,7 +112,7 @@ def is_mod():
         if (await ctx.message.member.guild_permissions()).administrator:
             return True
 
-        for role in (await tools.get_data(ctx.bot, ctx.guild.id))[3]:
+        for role in (await tools.get_data(ctx.bot, ctx.guild.id)).access_roles:
             if role in ctx.message.member._roles:
                 return True
 
@@ -0,0 +1,95 @@
+import time
+
+from contextlib import asynccontextmanager
+
+import aioredis
+
+
+class TimedRedis(aioredis.Redis):
+    prom = None
+
+    async def _timed(self, command, awaitable):
+        start = time.perf_counter()
+
+        try:
+            return await awaitable
+        finally:
+            self.prom.redis_latency.observe({"command": command}, time.perf_counter() - start)
+
+    def execute(self, command, *args, **kwargs):
+        result = super().execute(command, *args, **kwargs)
+        if self.prom is None:
+            return result
+
+        if isinstance(command, bytes):
+            command = command.decode("utf-8")
+
+        return self._timed(command.upper(), result)
+
+    def pipeline(self):
+        pipe = super().pipeline()
+        if self.prom is None:
+            return pipe
+
+        execute = pipe.execute
+        pipe.execute = lambda **kwargs: self._timed("PIPELINE", execute(**kwargs))
+        return pipe
+
+
+class TimedConnection:
+    def __init__(self, conn, prom):
+        self._conn = conn
+        self._prom = prom
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _timed(self, query, func, *args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self._prom.postgres_latency.observe({"query": query}, time.perf_counter() - start)
+
+    async def execute(self, *args, **kwargs):
+        return await self._timed("execute", self._conn.execute, *args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        return await self._timed("executemany", self._conn.executemany, *args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        return await self._timed("fetch", self._conn.fetch, *args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        return await self._timed("fetchrow", self._conn.fetchrow, *args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        return await self._timed("fetchval", self._conn.fetchval, *args, **kwargs)
+
+    async def copy_records_to_table(self, *args, **kwargs):
+        return await self._timed("copy", self._conn.copy_records_to_table, *args, **kwargs)
+
+
+class TimedPool:
+    def __init__(self, pool, prom):
+        self._pool = pool
+        self._prom = prom
+
+        self.in_use = 0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+
+        async with self._pool.acquire(*args, **kwargs) as conn:
+            self._prom.postgres_acquire.observe({}, time.perf_counter() - start)
+            self.in_use += 1
+
+            try:
+                yield TimedConnection(conn, self._prom)
+            finally:
+                self.in_use -= 1
@@ -0,0 +1,40 @@
+import sys
+import time
+import tracemalloc
+
+from collections import Counter
+
+
+def sample_stacks(thread_id, duration, interval=0.005):
+    stacks = Counter()
+    end = time.monotonic() + duration
+
+    while time.monotonic() < end:
+        frame = sys._current_frames().get(thread_id)
+
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+
+        if stack:
+            stacks[";".join(reversed(stack))] += 1
+
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def start_memory_trace():
+    if tracemalloc.is_tracing():
+        return False
+
+    tracemalloc.start(25)
+    return True
+
+
+def memory_diff(before, after, limit=50):
+    stats = after.compare_to(before, "lineno")
+
+    return "".join(f"{str(stat)}\n" for stat in stats[:limit])
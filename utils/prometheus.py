@@ -1,17 +1,63 @@
 import asyncio
 import gc
+import hmac
+import logging
 import os
 import platform
 import resource
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
 
-from aioprometheus import Collector, Counter, Gauge, Service
+from collections import Counter as Tally
+
+from aiohttp import web
+from aioprometheus import Collector, Counter, Gauge, Histogram, Service
+from aioprometheus.service import DEFAULT_METRICS_PATH
+
+from utils import profiler
+
+log = logging.getLogger(__name__)
+
+
+class MetricsService(Service):
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+
+    async def start(self, addr="", port=0, ssl=None, metrics_url=DEFAULT_METRICS_PATH):
+        if self._site:
+            log.warning("The metrics server is already running.")
+            return
+
+        self._app = web.Application()
+        self._metrics_url = metrics_url
+        self._app["metrics_url"] = metrics_url
+        self._app.router.add_get(metrics_url, self.handle_metrics)
+        self._app.router.add_get(self._root_url, self.handle_root)
+        self._app.router.add_get("/robots.txt", self.handle_robots)
+
+        for path, handler in self.routes.items():
+            self._app.router.add_get(path, handler)
+
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+
+        self._https = ssl is not None
+        self._site = web.TCPSite(self._runner, addr, port, ssl_context=ssl, shutdown_timeout=2.0)
+        await self._site.start()
 
 
 class Prometheus:
     def __init__(self, bot):
         self.bot = bot
 
-        self.msvr = Service()
+        self.msvr = MetricsService(
+            {"/debug/profile": self.handle_profile, "/debug/memory": self.handle_memory}
+        )
+        self.memory_lock = asyncio.Lock()
 
         if platform.system() == "Linux":
             self.platform = platform
@@ -41,13 +87,106 @@ class Prometheus:
             "python_gc_collections", "Number of times this generation was collected."
         )
 
+        self.loop_lag = Histogram("python_loop_lag_seconds", "Event loop scheduling delay.")
+        self.tasks = Gauge("python_loop_tasks", "Number of live tasks by coroutine.")
+        self.slow_callbacks = Counter(
+            "python_loop_slow_callbacks", "Number of times the event loop was blocked."
+        )
+
+        self.heartbeat = time.monotonic()
+        self.stalls = 0
+        self.task_names = set()
+
         self.http = Counter("modmail_http_requests", "Number of http requests sent to Discord.")
+        self.http_latency = Histogram(
+            "modmail_http_request_seconds", "Time taken by http requests sent to Discord."
+        )
         self.commands = Counter("modmail_commands", "Number of commands used on the bot.")
         self.tickets = Counter("modmail_tickets", "Number of tickets created by the bot.")
         self.tickets_message = Counter(
             "modmail_tickets_message", "Number of messages sent in tickets."
         )
 
+        self.events_in_flight = Gauge(
+            "modmail_events_in_flight", "Number of gateway events being processed."
+        )
+        self.events_dropped = Counter(
+            "modmail_events_dropped", "Number of gateway events dropped without decoding."
+        )
+        self.events_latency = Histogram(
+            "modmail_events_seconds", "Time taken to handle gateway events."
+        )
+        self.events_queue_wait = Histogram(
+            "modmail_events_queue_wait_seconds",
+            "Time gateway events spent waiting before being processed.",
+        )
+
+        self.premium_expired = Counter(
+            "modmail_premium_expired", "Number of premium subscriptions that expired."
+        )
+
+        self.timers_pending = Gauge("modmail_timers_pending", "Number of scheduled timers.")
+        self.timers_fired = Counter("modmail_timers_fired", "Number of timers fired.")
+        self.timers_lag = Histogram(
+            "modmail_timers_lag_seconds", "Time between a timer's deadline and it firing."
+        )
+
+        self.ratelimit_wait = Histogram(
+            "modmail_ratelimit_wait_seconds", "Time spent waiting on shared rate limits."
+        )
+        self.ratelimit_avoided = Counter(
+            "modmail_ratelimit_avoided", "Number of requests delayed by shared rate limits."
+        )
+        self.ratelimit_hits = Counter(
+            "modmail_ratelimit_hits", "Number of rate limited responses from Discord."
+        )
+
+        self.select_guild = Histogram(
+            "modmail_select_guild_seconds", "Time taken to show the server selection menu."
+        )
+
+        self.attachment_bytes = Counter(
+            "modmail_attachment_bytes", "Number of attachment bytes relayed."
+        )
+
+        self.transcript_build = Histogram(
+            "modmail_transcript_build_seconds", "Time taken to build ticket transcripts."
+        )
+        self.transcript_size = Histogram(
+            "modmail_transcript_size_bytes",
+            "Size of ticket transcripts.",
+            buckets=[1024, 16384, 65536, 262144, 1048576, 4194304, float("inf")],
+        )
+
+        self.redis_latency = Histogram(
+            "modmail_redis_command_seconds", "Time taken by Redis commands."
+        )
+        self.postgres_latency = Histogram(
+            "modmail_postgres_query_seconds", "Time taken by PostgreSQL queries."
+        )
+        self.postgres_acquire = Histogram(
+            "modmail_postgres_acquire_seconds", "Time taken to acquire a PostgreSQL connection."
+        )
+        self.postgres_pool_in_use = Gauge(
+            "modmail_postgres_pool_in_use", "Number of PostgreSQL connections in use."
+        )
+        self.redis_pool_size = Gauge(
+            "modmail_redis_pool_size", "Number of connections in the Redis pool."
+        )
+        self.redis_pool_idle = Gauge(
+            "modmail_redis_pool_idle", "Number of idle connections in the Redis pool."
+        )
+
+        self.cache_hits = Counter("modmail_state_cache_hits", "Number of state cache hits.")
+        self.cache_misses = Counter("modmail_state_cache_misses", "Number of state cache misses.")
+        self.cache_evictions = Counter(
+            "modmail_state_cache_evictions", "Number of state cache entries evicted."
+        )
+        self.cache_expirations = Counter(
+            "modmail_state_cache_expirations", "Number of state cache entries expired."
+        )
+        self.cache_size = Gauge("modmail_state_cache_size", "Number of state cache entries.")
+
     async def start(self):
         for name, value in vars(self).items():
             if issubclass(type(value), Collector):
@@ -60,6 +199,19 @@ class Prometheus:
             self.bot.loop.create_task(self.update_process_stats())
             self.bot.loop.create_task(self.update_platform_stats())
 
+        if self.bot._cache is not None:
+            self.bot.loop.create_task(self.update_cache_stats())
+
+        self.bot.loop.create_task(self.update_pool_stats())
+        self.bot.loop.create_task(self.update_loop_lag())
+        self.bot.loop.create_task(self.update_task_stats())
+
+        threading.Thread(
+            target=self.watch_loop,
+            args=(threading.get_ident(), float(self.bot.config.LOOP_SLOW_CALLBACK or 0.5)),
+            daemon=True,
+        ).start()
+
     async def update_process_stats(self):
         while True:
             with open(os.path.join(self.pid, "stat"), "rb") as stat:
@@ -92,3 +244,105 @@ class Prometheus:
                 self.collections.set({"generation": str(gen)}, stat["collections"])
 
             await asyncio.sleep(5)
+
+    async def update_cache_stats(self):
+        while True:
+            cache = self.bot._cache
+
+            self.cache_hits.set({}, cache.hits)
+            self.cache_misses.set({}, cache.misses)
+            self.cache_evictions.set({}, cache.evictions)
+            self.cache_expirations.set({}, cache.expirations)
+            self.cache_size.set({}, len(cache))
+
+            await asyncio.sleep(5)
+
+    async def update_pool_stats(self):
+        while True:
+            self.postgres_pool_in_use.set({}, self.bot.pool.in_use)
+            self.redis_pool_size.set({}, self.bot._redis.connection.size)
+            self.redis_pool_idle.set({}, self.bot._redis.connection.freesize)
+
+            await asyncio.sleep(5)
+
+    async def update_loop_lag(self):
+        while True:
+            start = self.bot.loop.time()
+            await asyncio.sleep(0.25)
+
+            self.heartbeat = time.monotonic()
+            self.loop_lag.observe({}, max(self.bot.loop.time() - start - 0.25, 0))
+            self.slow_callbacks.set({}, self.stalls)
+
+    async def update_task_stats(self):
+        while True:
+            tasks = Tally(
+                getattr(x.get_coro(), "__qualname__", "unknown")
+                for x in asyncio.all_tasks(self.bot.loop)
+            )
+
+            for name in self.task_names - tasks.keys():
+                self.tasks.set({"coroutine": name}, 0)
+
+            for name, count in tasks.items():
+                self.tasks.set({"coroutine": name}, count)
+
+            self.task_names |= tasks.keys()
+
+            await asyncio.sleep(5)
+
+    def watch_loop(self, thread_id, threshold):
+        reported = None
+
+        while True:
+            time.sleep(threshold / 2)
+
+            heartbeat = self.heartbeat
+            if time.monotonic() - heartbeat < threshold + 0.25 or reported == heartbeat:
+                continue
+
+            reported = heartbeat
+            self.stalls += 1
+
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                log.warning(
+                    f"Event loop blocked for over {threshold} seconds:\n"
+                    f"{''.join(traceback.format_stack(frame))}"
+                )
+
+    def check_debug(self, request):
+        token = self.bot.config.PROFILER_TOKEN
+        header = request.headers.get("Authorization", "")
+        if token is None or not hmac.compare_digest(header.encode(), token.encode()):
+            raise web.HTTPNotFound()
+
+        try:
+            return min(max(float(request.query.get("seconds", 10)), 0), 60)
+        except ValueError:
+            raise web.HTTPBadRequest()
+
+    async def handle_profile(self, request):
+        seconds = self.check_debug(request)
+
+        stacks = await self.bot.loop.run_in_executor(
+            None, profiler.sample_stacks, threading.get_ident(), seconds
+        )
+
+        return web.Response(text=stacks)
+
+    async def handle_memory(self, request):
+        seconds = self.check_debug(request)
+
+        async with self.memory_lock:
+            started = profiler.start_memory_trace()
+
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+            finally:
+                if started:
+                    tracemalloc.stop()
+
+        return web.Response(text=profiler.memory_diff(before, after))
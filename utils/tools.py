@@ -1,15 +1,19 @@
+import asyncio
 import logging
+import tempfile
 import time
+import uuid
 
 import discord
 
 from discord.http import Route
 from discord.user import User
 
-from classes.channel import DMChannel
+from classes.channel import DMChannel, TextChannel
 from classes.embed import Embed, ErrorEmbed
 from classes.http import HTTPClient
 from classes.message import Message
+from classes.misc import GuildConfig
 
 log = logging.getLogger(__name__)
 
@@ -82,8 +86,10 @@ async def create_paginator(bot, ctx, pages):
     for reaction in ["⏮️", "◀️", "⏹️", "▶️", "⏭️"]:
         await msg.add_reaction(reaction)
 
-    await bot.state.set(
-        f"reaction_menu:{msg.channel.id}:{msg.id}",
+    await set_reaction_menu(
+        bot,
+        msg.channel.id,
+        msg.id,
         {
             "kind": "paginator",
             "end": int(time.time()) + 180,
@@ -93,10 +99,10 @@ async def create_paginator(bot, ctx, pages):
             },
         },
     )
-    await bot.state.sadd("reaction_menu_keys", f"reaction_menu:{msg.channel.id}:{msg.id}")
 
 
 async def select_guild(bot, message, msg):
+    start = time.perf_counter()
     guilds = {}
 
     user_guilds = await get_user_guilds(bot, message.author)
@@ -118,20 +124,8 @@ async def select_guild(bot, message, msg):
 
         return
 
-    for guild in user_guilds:
-        guild = await bot.get_guild(guild)
-        if guild is None:
-            continue
-
-        channel = None
-        for text_channel in await guild.text_channels():
-            if is_modmail_channel(text_channel, message.author.id):
-                channel = text_channel
-
-        if not channel:
-            guilds[str(guild.id)] = (guild.name, False)
-        else:
-            guilds[str(guild.id)] = (guild.name, True)
+    for guild, channel in zip(*await get_user_tickets(bot, user_guilds, message.author.id)):
+        guilds[str(guild.id)] = (guild.name, channel is not None)
 
     if len(guilds) == 0:
         await message.channel.send(ErrorEmbed("Oops, something strange happened. No server found."))
@@ -165,8 +159,10 @@ async def select_guild(bot, message, msg):
     ]:
         await msg.add_reaction(reaction)
 
-    await bot.state.set(
-        f"reaction_menu:{msg.channel.id}:{msg.id}",
+    await set_reaction_menu(
+        bot,
+        msg.channel.id,
+        msg.id,
         {
             "kind": "selection",
             "end": int(time.time()) + 180,
@@ -177,7 +173,27 @@ async def select_guild(bot, message, msg):
             },
         },
     )
-    await bot.state.sadd("reaction_menu_keys", f"reaction_menu:{msg.channel.id}:{msg.id}")
+
+    bot.prom.select_guild.observe({}, time.perf_counter() - start)
+
+
+async def schedule_timer(bot, key, deadline):
+    await bot.state.zadd("timers", deadline, key)
+    await bot.state.publish("timers", deadline)
+
+
+async def cancel_timer(bot, key):
+    await bot.state.zrem("timers", key)
+
+
+async def set_reaction_menu(bot, channel_id, message_id, menu):
+    await bot.state.set(f"reaction_menu:{channel_id}:{message_id}", menu)
+    await schedule_timer(bot, f"reaction_menu:{channel_id}:{message_id}", menu["end"])
+
+
+async def remove_reaction_menu(bot, channel_id, message_id):
+    await bot.state.delete(f"reaction_menu:{channel_id}:{message_id}")
+    await cancel_timer(bot, f"reaction_menu:{channel_id}:{message_id}")
 
 
 async def get_reaction_menu(bot, payload, kind):
@@ -192,25 +208,38 @@ async def get_reaction_menu(bot, payload, kind):
 
 
 async def get_data(bot, guild):
+    data = bot.data_cache.get(f"data:{guild}")
+    if data is not None:
+        return data
+
     async with bot.pool.acquire() as conn:
         res = await conn.fetchrow("SELECT * FROM data WHERE guild=$1", guild)
-        if res:
-            return res
+        if not res:
+            res = await conn.fetchrow(
+                "INSERT INTO data VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) "
+                "RETURNING *",
+                guild,
+                None,
+                None,
+                [],
+                None,
+                None,
+                None,
+                False,
+                [],
+                [],
+                False,
+            )
+
+    data = GuildConfig(res)
+    bot.data_cache.set(f"data:{guild}", data)
+
+    return data
 
-        return await conn.fetchrow(
-            "INSERT INTO data VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) RETURNING *",
-            guild,
-            None,
-            None,
-            [],
-            None,
-            None,
-            None,
-            False,
-            [],
-            [],
-            False,
-        )
+
+async def invalidate_data(bot, guild):
+    bot.data_cache.invalidate(f"data:{guild}")
+    await bot.state.publish("data_invalidate", guild)
 
 
 async def get_guild_prefix(bot, guild):
@@ -234,20 +263,101 @@ async def get_guild_prefix(bot, guild):
     return bot.config.DEFAULT_PREFIX
 
 
+async def set_conversation(bot, user, guild_id, channel_id):
+    await bot.state.set(
+        f"conversation:{user}",
+        {"guild": guild_id, "channel": channel_id, "active": int(time.time())},
+    )
+    await bot.state.expire(f"conversation:{user}", 2592000)
+
+
+async def get_conversation_guild(bot, user, channel):
+    conversation = await bot.state.get(f"conversation:{user}")
+    if conversation is not None:
+        return await bot.get_guild(conversation["guild"])
+
+    async for msg in channel.history(limit=30):
+        if (
+            msg.author.id == bot.id
+            and len(msg.embeds) > 0
+            and msg.embeds[0].title in ["Message Received", "Message Sent"]
+        ):
+            guild = await bot.get_guild(int(msg.embeds[0].footer.text.split()[-1]))
+            if guild:
+                await set_conversation(bot, user, guild.id, None)
+
+            return guild
+
+    return None
+
+
+async def download_attachment(bot, attachment):
+    file = tempfile.SpooledTemporaryFile(max_size=int(bot.config.ATTACHMENT_SPOOL_SIZE or 8388608))
+
+    async with bot.session.get(attachment.url) as response:
+        if response.status != 200:
+            file.close()
+            raise discord.HTTPException(response, "failed to get attachment")
+
+        async for chunk in response.content.iter_chunked(65536):
+            file.write(chunk)
+
+    bot.prom.attachment_bytes.add({"kind": "downloaded"}, file.tell())
+
+    file.seek(0)
+    return discord.File(file, attachment.filename)
+
+
+async def download_attachments(bot, attachments):
+    files = await asyncio.gather(
+        *[download_attachment(bot, x) for x in attachments], return_exceptions=True
+    )
+
+    errors = [x for x in files if isinstance(x, BaseException)]
+    if errors:
+        close_attachments([x for x in files if not isinstance(x, BaseException)])
+        raise errors[0]
+
+    return files
+
+
+def forward_attachments(bot):
+    return bot.config.ATTACHMENT_FORWARD in ["true", "True", "1"]
+
+
+def count_uploaded(bot, files):
+    for file in files:
+        file.fp.seek(0, 2)
+        bot.prom.attachment_bytes.add({"kind": "uploaded"}, file.fp.tell())
+        file.reset()
+
+
+def close_attachments(files):
+    for file in files:
+        file.close()
+        file.fp.close()
+
+
 async def get_user_settings(bot, user):
     async with bot.pool.acquire() as conn:
         return await conn.fetchrow("SELECT confirmation FROM account WHERE identifier=$1", user)
 
 
-async def get_user_guilds(bot, member):
-    user_guilds = await bot.state.get(f"user_guilds:{member.id}")
-    if user_guilds is not None:
-        return [int(guild) for guild in user_guilds]
+async def refresh_user_token(bot, user, schedule=False):
+    lock = uuid.uuid4().hex
+    if not await bot.state.setnx(f"user_token_lock:{user}", lock, 30):
+        for _ in range(20):
+            await asyncio.sleep(0.5)
+
+            token = await bot.state.get(f"user_token:{user}", False)
+            if token is not None:
+                return token
+
+        return None
 
-    token = await bot.state.get(f"user_token:{member.id}", False)
-    if token is None:
+    try:
         async with bot.pool.acquire() as conn:
-            res = await conn.fetchrow("SELECT token FROM account WHERE identifier=$1", member.id)
+            res = await conn.fetchrow("SELECT token FROM account WHERE identifier=$1", user)
 
         if not res or not res[0]:
             return None
@@ -263,39 +373,75 @@ async def get_user_guilds(bot, member):
         ) as response:
             if response.status != 200:
                 async with bot.pool.acquire() as conn:
-                    await conn.execute(
-                        "UPDATE account SET token=NULL WHERE identifier=$1",
-                        member.id,
-                    )
+                    await conn.execute("UPDATE account SET token=NULL WHERE identifier=$1", user)
                 return None
 
             response = await response.json()
 
         token = response["access_token"]
-        await bot.state.set(f"user_token:{member.id}", token)
-        await bot.state.expire(f"user_token:{member.id}", response["expires_in"])
+        await bot.state.set(f"user_token:{user}", token)
+        await bot.state.expire(f"user_token:{user}", response["expires_in"])
 
         async with bot.pool.acquire() as conn:
             await conn.execute(
-                "UPDATE account SET token=$1 WHERE identifier=$2",
-                response["refresh_token"],
-                member.id,
+                "UPDATE account SET token=$1 WHERE identifier=$2", response["refresh_token"], user
             )
+    finally:
+        await bot.state.delete_if(f"user_token_lock:{user}", lock)
 
-    http = HTTPClient()
-    http._HTTPClient__session = bot.session
-    http._token(f"Bearer {token}", bot=False)
+    if schedule is True:
+        await schedule_timer(
+            bot, f"user_token:{user}", int(time.time()) + max(response["expires_in"] - 300, 0)
+        )
 
-    try:
-        guilds = [guild["id"] for guild in await http.get_guilds(100)]
-    except discord.HTTPException:
-        await bot.state.delete(f"user_token:{member.id}")
-        return await get_user_guilds(bot, member)
+    return token
+
+
+async def fetch_user_guilds(bot, user):
+    for _ in range(2):
+        token = await bot.state.get(f"user_token:{user}", False)
+        if token is None:
+            token = await refresh_user_token(bot, user, True)
+            if token is None:
+                return None
+
+        http = HTTPClient()
+        http._HTTPClient__session = bot.session
+        http._token(f"Bearer {token}", bot=False)
+
+        try:
+            guilds = [int(guild["id"]) for guild in await http.get_guilds(100)]
+        except discord.HTTPException:
+            await bot.state.delete(f"user_token:{user}")
+            continue
+
+        await bot.state.set(f"user_guilds:{user}", {"guilds": guilds, "time": int(time.time())})
+        await bot.state.expire(f"user_guilds:{user}", 86400)
 
-    await bot.state.set(f"user_guilds:{member.id}", guilds)
-    await bot.state.expire(f"user_guilds:{member.id}", 10)
+        return guilds
 
-    return [int(guild) for guild in guilds]
+    return None
+
+
+def refresh_user_guilds(bot, user):
+    task = bot.user_guilds_requests.get(user)
+    if task is None:
+        task = bot.loop.create_task(fetch_user_guilds(bot, user))
+        task.add_done_callback(lambda _: bot.user_guilds_requests.pop(user, None))
+        bot.user_guilds_requests[user] = task
+
+    return task
+
+
+async def get_user_guilds(bot, member):
+    user_guilds = await bot.state.get(f"user_guilds:{member.id}")
+    if isinstance(user_guilds, dict):
+        if user_guilds["time"] + int(bot.config.USER_GUILDS_TTL or 300) < time.time():
+            refresh_user_guilds(bot, member.id)
+
+        return user_guilds["guilds"]
+
+    return await asyncio.shield(refresh_user_guilds(bot, member.id))
 
 
 async def get_premium_slots(bot, user):
@@ -333,6 +479,8 @@ async def remove_premium(bot, guild):
         )
         await conn.execute("DELETE FROM snippet WHERE guild=$1", guild)
 
+    await invalidate_data(bot, guild)
+
 
 async def is_user_banned(bot, user):
     return await bot.state.sismember("banned_users", user.id)
@@ -356,6 +504,81 @@ def is_modmail_channel(channel, user_id=None):
     return True
 
 
+async def build_ticket_index(bot, guild):
+    tickets = {}
+    for channel in await guild.text_channels():
+        if is_modmail_channel(channel):
+            tickets.setdefault(get_modmail_user(channel).id, channel.id)
+
+    if len(tickets) >= 1:
+        await bot.state.set(
+            [y for x in tickets.items() for y in (f"ticket:{guild.id}:{x[0]}", x[1])]
+        )
+        await bot.state.sadd(
+            f"ticket_keys:{guild.id}", *[f"ticket:{guild.id}:{x}" for x in tickets.keys()]
+        )
+
+    await bot.state.set(f"ticket_index:{guild.id}", 1)
+
+
+async def add_ticket(bot, guild, user_id, channel_id):
+    await bot.state.set(f"ticket:{guild.id}:{user_id}", channel_id)
+    await bot.state.sadd(f"ticket_keys:{guild.id}", f"ticket:{guild.id}:{user_id}")
+
+
+async def remove_ticket(bot, guild, user_id, channel_id=None):
+    if channel_id is not None:
+        if await bot.state.get(f"ticket:{guild.id}:{user_id}") != channel_id:
+            return
+
+    await bot.state.delete(f"ticket:{guild.id}:{user_id}")
+    await bot.state.srem(f"ticket_keys:{guild.id}", f"ticket:{guild.id}:{user_id}")
+
+
+async def _check_ticket(bot, guild, user_id, channel_id):
+    if channel_id is None:
+        return None
+
+    channel = await guild.get_channel(channel_id)
+    if not isinstance(channel, TextChannel) or not is_modmail_channel(channel, user_id):
+        await remove_ticket(bot, guild, user_id)
+        return None
+
+    return channel
+
+
+async def _get_indexed_ticket(bot, guild, user_id):
+    channel_id = await bot.state.get(f"ticket:{guild.id}:{user_id}")
+    return await _check_ticket(bot, guild, user_id, channel_id)
+
+
+async def get_ticket(bot, guild, user_id):
+    if await bot.state.get(f"ticket_index:{guild.id}") is None:
+        await build_ticket_index(bot, guild)
+
+    return await _get_indexed_ticket(bot, guild, user_id)
+
+
+async def get_tickets(bot, guild):
+    return [x for x in await guild.text_channels() if is_modmail_channel(x)]
+
+
+async def get_user_tickets(bot, guild_ids, user_id):
+    guilds = await bot.get_guilds(guild_ids)
+
+    indexed = await bot.state.mget([f"ticket_index:{x.id}" for x in guilds])
+    await asyncio.gather(
+        *[build_ticket_index(bot, x) for x, y in zip(guilds, indexed) if y is None]
+    )
+
+    channel_ids = await bot.state.mget([f"ticket:{x.id}:{user_id}" for x in guilds])
+    channels = await asyncio.gather(
+        *[_check_ticket(bot, x, user_id, y) for x, y in zip(guilds, channel_ids)]
+    )
+
+    return guilds, channels
+
+
 def get_modmail_user(channel):
     return create_fake_user(channel.topic.replace("ModMail Channel ", "").split(" ")[0])
 